@@ -27,3 +27,9 @@ class ProductAdmin(admin.ModelAdmin):
 class VersionAdmin(admin.ModelAdmin):
     list_display = ['version_name', 'version_number', 'is_current']
     list_filter = ['is_current']
+    actions = ['make_current']
+
+    @admin.action(description='Сделать текущей версией')
+    def make_current(self, request, queryset):
+        for version in queryset:
+            version.make_current()
@@ -0,0 +1,104 @@
+import asyncio
+import weakref
+
+from django.core.cache import cache, caches
+
+try:
+    from django_redis.cache import RedisCache
+    from redis import asyncio as aioredis
+except ImportError:
+    RedisCache = aioredis = None
+
+
+class DjangoAsyncCache:
+    # Запасной вариант для остальных бэкендов (locmem в тестах): штатные a*-методы Django
+
+    async def get(self, key, default=None):
+        return await cache.aget(key, default)
+
+    async def get_many(self, keys):
+        return await cache.aget_many(keys)
+
+    async def set(self, key, value, timeout):
+        await cache.aset(key, value, timeout)
+
+    async def set_many(self, mapping, timeout):
+        await cache.aset_many(mapping, timeout)
+
+    async def add(self, key, value, timeout):
+        return await cache.aadd(key, value, timeout)
+
+    async def delete(self, key):
+        await cache.adelete(key)
+
+
+class RedisAsyncCache:
+    # Неблокирующий клиент redis.asyncio поверх тех же ключей и сериализации, что у django_redis,
+    # поэтому синхронный и асинхронный код видят одни и те же записи
+    def __init__(self, backend):
+        self.backend = backend
+        self.clients = weakref.WeakKeyDictionary()
+
+    @property
+    def client(self):
+        # Пул соединений redis.asyncio привязан к event loop
+        loop = asyncio.get_running_loop()
+        client = self.clients.get(loop)
+        if client is None:
+            server = self.backend._server
+            url = server[0] if isinstance(server, (list, tuple)) else server.split(',')[0]
+            client = self.clients[loop] = aioredis.from_url(url)
+        return client
+
+    def make_key(self, key):
+        return str(self.backend.client.make_key(key))
+
+    def encode(self, value):
+        return self.backend.client.encode(value)
+
+    def decode(self, value):
+        return self.backend.client.decode(value)
+
+    def expiry_ms(self, timeout):
+        seconds = self.backend.get_backend_timeout(timeout)
+        return None if seconds is None else max(int(seconds * 1000), 1)
+
+    async def get(self, key, default=None):
+        value = await self.client.get(self.make_key(key))
+        return default if value is None else self.decode(value)
+
+    async def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = await self.client.mget([self.make_key(key) for key in keys])
+        return {key: self.decode(value) for key, value in zip(keys, values) if value is not None}
+
+    async def set(self, key, value, timeout):
+        await self.client.set(self.make_key(key), self.encode(value), px=self.expiry_ms(timeout))
+
+    async def set_many(self, mapping, timeout):
+        async with self.client.pipeline(transaction=False) as pipeline:
+            for key, value in mapping.items():
+                pipeline.set(self.make_key(key), self.encode(value), px=self.expiry_ms(timeout))
+            await pipeline.execute()
+
+    async def add(self, key, value, timeout):
+        return bool(await self.client.set(self.make_key(key), self.encode(value), nx=True,
+                                          px=self.expiry_ms(timeout)))
+
+    async def delete(self, key):
+        await self.client.delete(self.make_key(key))
+
+
+_adapters = weakref.WeakKeyDictionary()
+
+
+def get_async_cache():
+    backend = caches['default']
+    if RedisCache is not None and isinstance(backend, RedisCache):
+        adapter = _adapters.get(backend)
+        if adapter is None:
+            adapter = _adapters[backend] = RedisAsyncCache(backend)
+        return adapter
+    return DjangoAsyncCache()
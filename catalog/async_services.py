@@ -0,0 +1,147 @@
+import asyncio
+import time
+
+from django.core.paginator import EmptyPage
+
+from catalog.async_cache import get_async_cache
+from catalog.models import Category, Product
+from catalog.services import (
+    CACHE_SOFT_TIMEOUT, CACHE_TIMEOUT, LOCK_TIMEOUT, LOCK_WAIT_ATTEMPTS, LOCK_WAIT_INTERVAL, PRODUCT_PAGE_MAX_SIZE,
+    CacheEntry, _generation_key, _initial_generation, _is_fresh, blogpost_listing_queryset, blogpost_views_key,
+    product_listing_queryset, product_row_key,
+)
+from myshop.metrics import key_family, record_cache_lookup
+from myshop.replicas import read_from_primary
+
+# Асинхронные двойники функций catalog.services: те же ключи и формат записей, но без блокировки event loop
+
+
+async def aget_generations(*namespaces):
+    acache = get_async_cache()
+    keys = {namespace: _generation_key(namespace) for namespace in namespaces}
+    found = await acache.get_many(keys.values())
+    generations = {}
+    for namespace, key in keys.items():
+        generation = found.get(key)
+        if generation is None:
+            generation = _initial_generation()
+            if not await acache.add(key, generation, None):
+                generation = await acache.get(key, generation)
+        generations[namespace] = generation
+    return generations
+
+
+async def aversioned_key(key, *namespaces):
+    generations = await aget_generations(*namespaces)
+    suffix = '-'.join(str(generations[namespace]) for namespace in namespaces)
+    return f'{key}:g{suffix}'
+
+
+async def _aload(key, loader, ttl, soft_ttl):
+    started = time.monotonic()
+    with read_from_primary():
+        value = await loader()
+    delta = time.monotonic() - started
+    await get_async_cache().set(key, CacheEntry(value, time.time() + soft_ttl, delta), ttl)
+    return value
+
+
+async def acached(key, loader, ttl=CACHE_TIMEOUT, soft_ttl=CACHE_SOFT_TIMEOUT, beta=1.0):
+    acache = get_async_cache()
+    entry = await acache.get(key)
+    hit = isinstance(entry, CacheEntry)
+    record_cache_lookup(key_family(key), hits=int(hit), misses=int(not hit))
+    if hit and _is_fresh(entry, beta):
+        return entry.value
+
+    # Тот же ключ блокировки, что у single_flight: синхронные и асинхронные воркеры не пересчитывают вдвоём
+    lock_key = f'{key}:lock'
+    if await acache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            return await _aload(key, loader, ttl, soft_ttl)
+        finally:
+            await acache.delete(lock_key)
+    if hit:
+        return entry.value
+
+    for _ in range(LOCK_WAIT_ATTEMPTS):
+        await asyncio.sleep(LOCK_WAIT_INTERVAL)
+        entry = await acache.get(key)
+        if isinstance(entry, CacheEntry):
+            return entry.value
+    return await _aload(key, loader, ttl, soft_ttl)
+
+
+async def aget_categories():
+    async def load():
+        return [category async for category in Category.objects.all()]
+
+    return await acached(await aversioned_key('categories_list', 'categories'), load)
+
+
+async def aget_product_count():
+    return await acached(await aversioned_key('products_count', 'products'), product_listing_queryset().acount)
+
+
+async def aget_blogpost_count():
+    return await acached(await aversioned_key('blogposts_count', 'blogposts'), blogpost_listing_queryset().acount)
+
+
+async def aget_product_page_ids(number, per_page):
+    per_page = min(per_page, PRODUCT_PAGE_MAX_SIZE)
+    offset = (number - 1) * per_page
+
+    async def load():
+        queryset = product_listing_queryset().values_list('pk', flat=True)[offset:offset + per_page]
+        ids = [pk async for pk in queryset]
+        # Страница за последней: пустой список не кэшируется, иначе перебор номеров засоряет кэш
+        if not ids and number > 1:
+            raise EmptyPage(number)
+        return ids
+
+    try:
+        return await acached(await aversioned_key(f'products_page:{per_page}:{number}', 'products'), load)
+    except EmptyPage:
+        return []
+
+
+async def aget_products_by_ids(ids):
+    acache = get_async_cache()
+    keys = {pk: product_row_key(pk) for pk in ids}
+    found = await acache.get_many(keys.values())
+    rows = {pk: found[key] for pk, key in keys.items() if key in found}
+
+    missing = [pk for pk in ids if pk not in rows]
+    record_cache_lookup('product_row', hits=len(rows), misses=len(missing))
+    if missing:
+        with read_from_primary():
+            loaded = await Product.objects.defer('search_vector').with_current_version().ain_bulk(missing)
+        await acache.set_many({keys[pk]: product for pk, product in loaded.items()}, CACHE_TIMEOUT)
+        rows.update(loaded)
+
+    return [rows[pk] for pk in ids if pk in rows]
+
+
+async def aattach_cache_generations(products):
+    generations = await aget_generations(*[f'product:{product.pk}' for product in products])
+    for product in products:
+        product.cache_generation = generations[f'product:{product.pk}']
+    return products
+
+
+async def amerge_pending_views(blogposts):
+    keys = {blogpost.pk: blogpost_views_key(blogpost.pk) for blogpost in blogposts}
+    found = await get_async_cache().get_many(keys.values())
+    for blogpost in blogposts:
+        blogpost.view_count += found.get(keys[blogpost.pk]) or 0
+    return blogposts
+
+
+async def aget_blogpost_page(number, per_page):
+    offset = (number - 1) * per_page
+    return [post async for post in blogpost_listing_queryset()[offset:offset + per_page]]
+
+
+async def aget_product(pk):
+    queryset = Product.objects.select_related('category', 'owner').defer('search_vector').with_current_version()
+    return await queryset.aget(pk=pk)
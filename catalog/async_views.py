@@ -0,0 +1,143 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.paginator import InvalidPage, Paginator
+from django.http import Http404, HttpResponse
+from django.template.loader import render_to_string
+from django.views import View
+
+from catalog.async_cache import get_async_cache
+from catalog.async_services import (
+    aattach_cache_generations, acached, aget_blogpost_count, aget_blogpost_page, aget_categories, aget_generations,
+    aget_product, aget_product_count, aget_product_page_ids, aget_products_by_ids, amerge_pending_views,
+)
+from catalog.models import Product
+from catalog.services import PAGE_CACHE_TIMEOUT, page_cache_key
+from catalog.views import BlogPostListView, HomepageView, ProductListView
+from myshop.metrics import record_cache_lookup
+from myshop.replicas import pin_request_to_primary
+
+# Нативные async-версии страниц каталога для ASGI (CATALOG_ASYNC_VIEWS). Кэш читается через redis.asyncio,
+# ORM — через async-API Django; рендер шаблонов синхронный и выполняется одним переходом в поток
+
+
+def get_page_number(request):
+    try:
+        number = int(request.GET.get('page') or 1)
+    except ValueError:
+        raise Http404('Некорректный номер страницы')
+    # Отсекается до выборки: 0 и отрицательные номера дают отрицательный срез
+    if number < 1:
+        raise Http404('Номер страницы меньше 1')
+    return number
+
+
+def validate_page(number, per_page, count):
+    # Выход за последнюю страницу проверяется после выборки, которая идёт параллельно с подсчётом
+    paginator = Paginator(range(count), per_page)
+    try:
+        return paginator, paginator.validate_number(number)
+    except InvalidPage as e:
+        raise Http404(str(e))
+
+
+class AsyncTemplateView(View):
+    template_name = None
+
+    async def render(self, request, context):
+        content = await sync_to_async(render_to_string)(self.template_name, context, request)
+        return HttpResponse(content)
+
+
+class AsyncProductPageView(AsyncTemplateView):
+    paginate_by = 10
+    sync_view = None
+    searchable = False
+
+    def use_sync_view(self, request):
+        # Поиск и курсорная пагинация остаются на синхронном пути
+        if self.searchable and request.GET.get('q', '').strip():
+            return True
+        return settings.CATALOG_PAGINATION == 'keyset'
+
+    async def get(self, request):
+        if self.use_sync_view(request):
+            return await sync_to_async(self.sync_view.as_view())(request)
+        number = get_page_number(request)
+        count, ids = await asyncio.gather(aget_product_count(), aget_product_page_ids(number, self.paginate_by))
+        paginator, number = validate_page(number, self.paginate_by, count)
+        products = await aattach_cache_generations(await aget_products_by_ids(ids))
+        page = paginator._get_page(products, number, paginator)
+        return await self.render(request, {
+            'products': products, 'page_obj': page, 'paginator': page.paginator,
+            'is_paginated': page.has_other_pages(), 'query': '',
+        })
+
+
+class AsyncHomepageView(AsyncProductPageView):
+    template_name = 'catalog/homepage.html'
+    sync_view = HomepageView
+    searchable = True
+
+
+class AsyncProductListView(AsyncProductPageView):
+    template_name = 'catalog/product_list.html'
+    sync_view = ProductListView
+
+
+class AsyncProductDetailView(AsyncTemplateView):
+    template_name = 'catalog/product_detail.html'
+
+    async def get(self, request, pk):
+        user = await request.auser()
+        acache = get_async_cache()
+        cache_key = page_cache_key(request.path)
+        cacheable = not request.GET and 'messages' not in request.COOKIES and not user.is_authenticated
+        if cacheable:
+            content = await acache.get(cache_key)
+            record_cache_lookup('page', hits=int(content is not None), misses=int(content is None))
+            if content is not None:
+                return HttpResponse(content)
+            pin_request_to_primary()
+
+        generations = await aget_generations(f'product:{pk}', 'categories')
+        cache_generation = '-'.join(str(generation) for generation in generations.values())
+
+        async def load():
+            try:
+                return await aget_product(pk)
+            except Product.DoesNotExist:
+                raise Http404('Продукт не найден')
+
+        product = await acached(f'product_{pk}:g{cache_generation}', load)
+        response = await self.render(request, {
+            'product': product, 'object': product, 'cache_generation': cache_generation,
+        })
+        if cacheable:
+            await acache.set(cache_key, response.content, PAGE_CACHE_TIMEOUT)
+        return response
+
+
+class AsyncCategoryListView(AsyncTemplateView):
+    template_name = 'catalog/category_list.html'
+
+    async def get(self, request):
+        return await self.render(request, {'categories': await aget_categories()})
+
+
+class AsyncBlogPostListView(AsyncTemplateView):
+    template_name = 'catalog/blogpost_list.html'
+    paginate_by = 10
+
+    async def get(self, request):
+        if settings.CATALOG_PAGINATION == 'keyset':
+            return await sync_to_async(BlogPostListView.as_view())(request)
+        number = get_page_number(request)
+        count, posts = await asyncio.gather(aget_blogpost_count(), aget_blogpost_page(number, self.paginate_by))
+        paginator, number = validate_page(number, self.paginate_by, count)
+        page = paginator._get_page(await amerge_pending_views(posts), number, paginator)
+        return await self.render(request, {
+            'blog_posts': page.object_list, 'page_obj': page, 'paginator': page.paginator,
+            'is_paginated': page.has_other_pages(),
+        })
@@ -0,0 +1,203 @@
+import pickle
+import threading
+from array import array
+from collections import Counter
+
+from django.core.cache import cache
+from rapidfuzz import fuzz, process, utils
+
+from catalog.models import Product
+from catalog.services import single_flight
+
+SNAPSHOT_KEY = 'autocomplete:snapshot'
+SNAPSHOT_SEQ_KEY = 'autocomplete:snapshot_seq'
+SEQUENCE_KEY = 'autocomplete:seq'
+JOURNAL_TIMEOUT = 60 * 60 * 24
+SNAPSHOT_EVERY = 500
+MAX_CATCH_UP = 5000
+CANDIDATES_LIMIT = 200
+POSTINGS_BUDGET = 20000
+
+
+def normalize(text):
+    return utils.default_process(text or '')
+
+
+def trigrams(text):
+    # Как в pg_trgm: слова дополняются пробелами, чтобы короткие запросы тоже давали триграммы
+    grams = set()
+    for word in normalize(text).split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    def __init__(self, seq=0):
+        self.seq = seq
+        self.names = {}
+        self.postings = {}
+
+    def add(self, pk, name):
+        # Массивы не меняются на месте, а заменяются: старую версию индекса могут читать без блокировки
+        self.remove(pk)
+        self.names[pk] = name
+        for gram in trigrams(name):
+            posting = array('q', self.postings.get(gram, ()))
+            posting.append(pk)
+            self.postings[gram] = posting
+
+    def load(self, pk, name):
+        # Первичное наполнение ещё никому не видимого индекса — дописываем на месте
+        self.names[pk] = name
+        for gram in trigrams(name):
+            self.postings.setdefault(gram, array('q')).append(pk)
+
+    def remove(self, pk):
+        name = self.names.pop(pk, None)
+        if name is None:
+            return
+        for gram in trigrams(name):
+            posting = self.postings.get(gram)
+            if posting is None:
+                continue
+            posting = array('q', (item for item in posting if item != pk))
+            if posting:
+                self.postings[gram] = posting
+            else:
+                del self.postings[gram]
+
+    def apply(self, pk, name):
+        if name is None:
+            self.remove(pk)
+        else:
+            self.add(pk, name)
+
+    def search(self, query, limit=10):
+        grams = trigrams(query)
+        if not grams:
+            return []
+        postings = sorted(
+            (self.postings[gram] for gram in grams if gram in self.postings), key=len
+        )
+        overlap = Counter()
+        scanned = 0
+        for posting in postings:
+            # Самые частые триграммы почти ничего не различают — начинаем с редких и держим бюджет
+            if scanned and scanned + len(posting) > POSTINGS_BUDGET:
+                break
+            overlap.update(posting)
+            scanned += len(posting)
+        candidates = {pk: self.names[pk] for pk, _ in overlap.most_common(CANDIDATES_LIMIT)}
+        matches = process.extract(
+            query, candidates, scorer=fuzz.WRatio, processor=utils.default_process, limit=limit
+        )
+        return [(pk, name, score) for name, score, pk in matches]
+
+    def copy(self):
+        # Неглубокая копия: add и remove заменяют только затронутые массивы, остальные общие со старой версией
+        index = TrigramIndex(self.seq)
+        index.names = dict(self.names)
+        index.postings = dict(self.postings)
+        return index
+
+    def dumps(self):
+        return pickle.dumps((self.seq, self.names, self.postings), protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def loads(cls, payload):
+        index = cls()
+        index.seq, index.names, index.postings = pickle.loads(payload)
+        return index
+
+
+def journal_key(seq):
+    return f'autocomplete:journal:{seq}'
+
+
+def current_sequence():
+    return cache.get(SEQUENCE_KEY) or 0
+
+
+def record_change(pk, name):
+    # Изменения пишутся в журнал в Redis, каждый воркер догоняет его при следующем запросе
+    try:
+        seq = cache.incr(SEQUENCE_KEY)
+    except ValueError:
+        cache.add(SEQUENCE_KEY, 0, timeout=None)
+        seq = cache.incr(SEQUENCE_KEY)
+    cache.set(journal_key(seq), (pk, name), timeout=JOURNAL_TIMEOUT)
+
+
+def invalidate_index():
+    # Сдвиг последовательности без записи в журнал заставит воркеров перестроить индекс
+    cache.delete_many([SNAPSHOT_KEY, SNAPSHOT_SEQ_KEY])
+    try:
+        cache.incr(SEQUENCE_KEY)
+    except ValueError:
+        cache.add(SEQUENCE_KEY, 1, timeout=None)
+
+
+def build_index():
+    index = TrigramIndex(current_sequence())
+    products = Product.objects.filter(is_published=True).values_list('pk', 'name')
+    for pk, name in products.iterator(chunk_size=5000):
+        index.load(pk, name)
+    return index
+
+
+def save_snapshot(index):
+    cache.set_many({SNAPSHOT_KEY: index.dumps(), SNAPSHOT_SEQ_KEY: index.seq}, timeout=None)
+
+
+def load_snapshot():
+    payload = cache.get(SNAPSHOT_KEY)
+    return TrigramIndex.loads(payload) if payload is not None else None
+
+
+def _catch_up(index, seq):
+    if index.seq > seq or seq - index.seq > MAX_CATCH_UP:
+        return None
+    keys = [journal_key(i) for i in range(index.seq + 1, seq + 1)]
+    entries = cache.get_many(keys)
+    if len(entries) != len(keys):
+        # Часть журнала уже истекла — догнать невозможно, нужна свежая копия
+        return None
+    # Общий индекс читают без блокировки, поэтому изменения применяются к копии, а ссылка подменяется целиком
+    index = index.copy()
+    for key in keys:
+        index.apply(*entries[key])
+    index.seq = seq
+    return index
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    seq = current_sequence()
+    with _lock:
+        index = _index
+        if index is not None and index.seq == seq:
+            return index
+        caught_up = _catch_up(index, seq) if index is not None else None
+        if caught_up is None:
+            # Новый воркер стартует со снимка из Redis, а не с полного чтения таблицы
+            snapshot = load_snapshot()
+            caught_up = _catch_up(snapshot, seq) if snapshot is not None else None
+            if caught_up is None:
+                caught_up = build_index()
+                save_snapshot(caught_up)
+        index = caught_up
+        if index.seq - (cache.get(SNAPSHOT_SEQ_KEY) or 0) >= SNAPSHOT_EVERY:
+            with single_flight(SNAPSHOT_KEY) as acquired:
+                if acquired:
+                    save_snapshot(index)
+        _index = index
+    return index
+
+
+def autocomplete(query, limit=10):
+    return get_index().search(query, limit)
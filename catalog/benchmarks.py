@@ -0,0 +1,128 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.text import slugify
+
+from catalog.importers import CatalogImporter
+from catalog.models import BlogPost, Product, Version
+from catalog.services import bump_generation
+
+WORDS = [
+    'смартфон', 'ноутбук', 'планшет', 'наушники', 'камера', 'монитор', 'клавиатура', 'мышь', 'колонка', 'часы',
+    'чайник', 'пылесос', 'утюг', 'кофеварка', 'холодильник', 'роутер', 'принтер', 'сканер', 'проектор', 'дрон',
+]
+ADJECTIVES = ['компактный', 'мощный', 'беспроводной', 'умный', 'игровой', 'тихий', 'лёгкий', 'надёжный']
+
+
+def synthetic_rows(products, categories, rng):
+    category_names = [f'Категория {index}' for index in range(categories)]
+    for index in range(products):
+        words = rng.sample(WORDS, 2)
+        yield {
+            'name': f'{rng.choice(ADJECTIVES).capitalize()} {words[0]} {index}',
+            'description': ' '.join(rng.choices(ADJECTIVES + WORDS, k=30)),
+            'price': f'{rng.randint(100, 200000)}.{rng.randint(0, 99):02d}',
+            'category': category_names[index % categories],
+            'available': rng.random() > 0.1,
+            'is_published': rng.random() > 0.2,
+        }
+
+
+def seed_catalog(products=1000, categories=20, versions=2, blog_posts=100, seed=0, batch_size=1000):
+    # Детерминированный набор данных: один и тот же seed даёт одинаковый каталог между коммитами
+    rng = random.Random(seed)
+    owner, _ = get_user_model().objects.get_or_create(
+        email='benchmark@example.com', defaults={'username': 'benchmark'}
+    )
+    CatalogImporter(owner, batch_size=batch_size).import_rows(synthetic_rows(products, categories, rng))
+
+    product_ids = Product.objects.filter(owner=owner, versions__isnull=True).values_list('pk', flat=True)
+    Version.objects.bulk_create(
+        (
+            Version(product_id=pk, version_number=str(number), version_name=f'Версия {number}',
+                    is_current=number == versions)
+            for pk in product_ids.iterator()
+            for number in range(1, versions + 1)
+        ),
+        batch_size=batch_size,
+    )
+    first_post = BlogPost.objects.count()
+    BlogPost.objects.bulk_create(
+        (
+            BlogPost(title=f'Обзор {index}', slug=slugify(f'benchmark-post-{index}'),
+                     content=' '.join(rng.choices(WORDS, k=200)), is_published=index % 5 != 0)
+            for index in range(first_post, first_post + blog_posts)
+        ),
+        batch_size=batch_size,
+    )
+    bump_generation('products')
+    bump_generation('blogposts')
+    return owner
+
+
+def default_endpoints():
+    product = Product.objects.published().order_by('pk').first()
+    blogpost = BlogPost.objects.filter(is_published=True).order_by('pk').first()
+    endpoints = {
+        'homepage': reverse('catalog:homepage'),
+        'product_list': reverse('catalog:product_list'),
+        'blogpost_list': reverse('catalog:blogpost_list'),
+        'category_list': reverse('catalog:category_list'),
+        'search': reverse('catalog:homepage') + f'?q={WORDS[0]}',
+    }
+    if product:
+        endpoints['product_detail'] = reverse('catalog:product_detail', args=[product.pk])
+    if blogpost:
+        endpoints['blogpost_detail'] = reverse('catalog:blogpost_detail', args=[blogpost.pk])
+    return endpoints
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(client, url, requests=50, warmup=5, cold=False):
+    for _ in range(warmup):
+        client.get(url)
+    timings, queries, sizes = [], [], []
+    for _ in range(requests):
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            response = client.get(url)
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+            timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f'{url} вернул {response.status_code}')
+        queries.append(len(context.captured_queries))
+        sizes.append(len(content))
+    return {
+        'url': url,
+        'requests': requests,
+        'latency_ms': {
+            'min': round(min(timings), 3),
+            'p50': round(percentile(timings, 0.5), 3),
+            'p90': round(percentile(timings, 0.9), 3),
+            'p99': round(percentile(timings, 0.99), 3),
+            'max': round(max(timings), 3),
+            'mean': round(statistics.fmean(timings), 3),
+        },
+        'queries': {'mean': round(statistics.fmean(queries), 2), 'max': max(queries)},
+        'bytes': {'mean': round(statistics.fmean(sizes)), 'max': max(sizes)},
+    }
+
+
+def run_benchmarks(endpoints=None, requests=50, warmup=5, cold=False, client=None):
+    client = client or Client()
+    endpoints = endpoints or default_endpoints()
+    return {name: measure(client, url, requests, warmup, cold) for name, url in sorted(endpoints.items())}
@@ -0,0 +1,70 @@
+import csv
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, OuterRef, Subquery
+
+from catalog.models import Product, Version
+
+# Названия колонок совпадают с форматом импортёра (catalog.importers), выгрузку можно загрузить обратно
+EXPORT_FIELDS = [
+    'id', 'name', 'description', 'price', 'available', 'is_published', 'created_at',
+    'category', 'version_number', 'version_name',
+]
+EXPORT_FORMATS = ('csv', 'jsonl')
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def export_queryset():
+    current = Version.objects.filter(product=OuterRef('pk'), is_current=True).order_by()
+    return Product.objects.order_by('pk').annotate(
+        category_name=F('category__name'),
+        version_number=Subquery(current.values('version_number')[:1]),
+        version_name=Subquery(current.values('version_name')[:1]),
+    ).values_list(
+        'pk', 'name', 'description', 'price', 'available', 'is_published', 'created_at',
+        'category_name', 'version_number', 'version_name',
+    )
+
+
+def iter_products(chunk_size=DEFAULT_CHUNK_SIZE):
+    # На PostgreSQL iterator() читает через серверный курсор — в памяти только текущая пачка строк
+    return export_queryset().iterator(chunk_size=chunk_size)
+
+
+class _Line:
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def iter_jsonl(rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(EXPORT_FIELDS, row))) + '\n'
+
+
+def iter_export(file_format, chunk_size=DEFAULT_CHUNK_SIZE, compress=False):
+    writer = iter_csv if file_format == 'csv' else iter_jsonl
+    chunks = (line.encode() for line in writer(iter_products(chunk_size)))
+    return gzip_stream(chunks) if compress else chunks
+
+
+def gzip_stream(chunks, flush_every=64 * 1024):
+    compressor = zlib.compressobj(wbits=31)
+    pending = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        pending += len(chunk)
+        if pending >= flush_every:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if data:
+            yield data
+    yield compressor.flush()
@@ -1,5 +1,6 @@
 from django import forms
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from .models import Product, Version
 
 
@@ -14,9 +15,28 @@ class StyledFormMixin:
 
 
 class VersionForm(StyledFormMixin, forms.ModelForm):
+    # Флаг не пишется в модель напрямую: переключение делает Version.make_current()
+    is_current = forms.BooleanField(required=False, label='Текущая версия')
+
     class Meta:
         model = Version
-        fields = ['product', 'version_number', 'version_name', 'is_current']
+        fields = ['product', 'version_number', 'version_name']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['is_current'].initial = self.instance.is_current
+
+    def save(self, commit=True):
+        if not commit:
+            return super().save(commit=False)
+        with transaction.atomic():
+            version = super().save()
+            if self.cleaned_data['is_current']:
+                version.make_current()
+            elif version.is_current:
+                Version.objects.filter(pk=version.pk).update(is_current=False)
+                version.is_current = False
+        return version
 
 
 class FeedbackForm(forms.Form, StyledFormMixin):
@@ -26,6 +46,8 @@ class FeedbackForm(forms.Form, StyledFormMixin):
 
 
 class ProductForm(forms.ModelForm):
+    forbidden_words = ['казино', 'криптовалюта', 'крипта', 'биржа', 'дешево', 'бесплатно', 'обман', 'полиция', 'радар']
+
     class Meta:
         model = Product
         fields = ['name', 'price', 'category', 'available', 'image']
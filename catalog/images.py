@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from PIL import Image, ImageOps, features
+
+from catalog.services import bump_generation
+
+BREAKPOINTS = (320, 640, 1024)
+DERIVATIVES_DIR = 'derivatives'
+MANIFEST_DIR = os.path.join(DERIVATIVES_DIR, 'manifests')
+MANIFEST_TIMEOUT = 60 * 60 * 24
+SAVE_OPTIONS = {
+    'jpeg': {'quality': 82, 'optimize': True, 'progressive': True},
+    'webp': {'quality': 80, 'method': 4},
+    'avif': {'quality': 60},
+}
+
+
+def available_formats():
+    # AVIF есть не во всех сборках Pillow — пропускаем, если кодека нет
+    return [fmt for fmt in ('avif', 'webp', 'jpeg') if fmt == 'jpeg' or features.check(fmt)]
+
+
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:20]
+
+
+def manifest_path(media_root, name):
+    return os.path.join(media_root, MANIFEST_DIR, hashlib.sha1(name.encode()).hexdigest() + '.json')
+
+
+def process_image(media_root, name, breakpoints=BREAKPOINTS, formats=None):
+    # Выполняется в отдельном процессе: только пути и Pillow, без ORM
+    formats = formats or available_formats()
+    source = os.path.join(media_root, name)
+    digest = content_hash(source)
+    variants = {fmt: [] for fmt in formats}
+
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        widths = sorted({min(width, original.width) for width in breakpoints})
+        for width in widths:
+            height = max(1, round(original.height * width / original.width))
+            resized = original.resize((width, height), Image.LANCZOS) if width != original.width else original
+            for fmt in formats:
+                relative = os.path.join(DERIVATIVES_DIR, digest[:2], f'{digest}-{width}.{fmt}')
+                target = os.path.join(media_root, relative)
+                if not os.path.exists(target):
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    image = resized.convert('RGB') if fmt == 'jpeg' else resized
+                    image.save(target + '.tmp', format=fmt.upper(), **SAVE_OPTIONS[fmt])
+                    os.replace(target + '.tmp', target)
+                variants[fmt].append([width, relative.replace(os.sep, '/')])
+
+    manifest = {'name': name, 'hash': digest, 'variants': variants}
+    path = manifest_path(media_root, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+    return manifest
+
+
+def derivatives_key(name):
+    return f'image_derivatives:{name}'
+
+
+def get_derivatives(name):
+    if not name:
+        return None
+    manifest = cache.get(derivatives_key(name))
+    if manifest is None:
+        try:
+            with open(manifest_path(str(settings.MEDIA_ROOT), name)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        cache.set(derivatives_key(name), manifest, MANIFEST_TIMEOUT)
+    return manifest
+
+
+def _store_manifest(manifest, namespace=None):
+    cache.set(derivatives_key(manifest['name']), manifest, MANIFEST_TIMEOUT)
+    if namespace:
+        # Закэшированные карточки ещё без srcset — сдвигаем поколение объекта
+        bump_generation(namespace)
+
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.IMAGE_PROCESSING_WORKERS)
+    return _executor
+
+
+def schedule_derivatives(name, namespace=None):
+    if not name or get_derivatives(name) is not None:
+        return None
+    if settings.IMAGE_PROCESSING_SYNC:
+        manifest = process_image(str(settings.MEDIA_ROOT), name)
+        _store_manifest(manifest, namespace)
+        return manifest
+
+    # Нарезка идёт в пуле процессов — воркер, принявший загрузку, не ждёт Pillow
+    def done(future):
+        if future.exception() is None:
+            _store_manifest(future.result(), namespace)
+
+    future = get_executor().submit(process_image, str(settings.MEDIA_ROOT), name)
+    future.add_done_callback(done)
+    return future
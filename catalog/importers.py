@@ -0,0 +1,202 @@
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.urls import reverse
+
+from catalog.autocomplete import invalidate_index
+from catalog.models import Category, Product
+from catalog.search import update_search_vectors
+from catalog.services import bump_generation, invalidate_product_rows, purge_pages
+
+PRODUCT_FIELDS = ['description', 'price', 'available', 'is_published']
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(stream):
+    # Потоковый разбор JSON-массива: в памяти только текущий кусок файла, а не весь документ
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if not started:
+            if buffer.startswith('['):
+                buffer = buffer[1:]
+                started = True
+                continue
+        elif buffer.startswith(','):
+            buffer = buffer[1:]
+            continue
+        elif buffer.startswith(']'):
+            return
+        elif buffer:
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                buffer = buffer[end:]
+                yield item
+                continue
+        if eof:
+            if started:
+                raise ValueError('Неожиданный конец JSON-массива')
+            return
+        chunk = stream.read(READ_CHUNK_SIZE)
+        eof = not chunk
+        buffer += chunk
+
+
+def iter_json_lines(stream):
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_csv(stream):
+    yield from csv.DictReader(stream)
+
+
+READERS = {
+    'jsonl': iter_json_lines,
+    'csv': iter_csv,
+    'json': iter_json_array,
+}
+
+
+def detect_format(path):
+    for suffix, name in (('.jsonl', 'jsonl'), ('.ndjson', 'jsonl'), ('.csv', 'csv'), ('.json', 'json')):
+        if str(path).endswith(suffix):
+            return name
+    raise ValueError(f'Не удалось определить формат файла {path}')
+
+
+def parse_bool(value, default):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'да')
+
+
+class CatalogImporter:
+    def __init__(self, owner, batch_size=1000, upsert=False, progress=None):
+        self.owner = owner
+        self.batch_size = batch_size
+        self.upsert = upsert
+        self.progress = progress
+        self.categories = dict(Category.objects.values_list('name', 'pk'))
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.started = None
+
+    @property
+    def processed(self):
+        return self.created + self.updated
+
+    @property
+    def rows_per_second(self):
+        elapsed = time.monotonic() - self.started if self.started else 0
+        return self.processed / elapsed if elapsed else 0.0
+
+    def import_file(self, path, file_format=None):
+        file_format = file_format or detect_format(path)
+        with open(path, encoding='utf-8', newline='') as stream:
+            return self.import_rows(READERS[file_format](stream))
+
+    def import_rows(self, rows):
+        self.started = time.monotonic()
+        batch = []
+        for row in rows:
+            product = self.build_product(row)
+            if product is None:
+                self.skipped += 1
+                continue
+            batch.append(product)
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch)
+                batch = []
+        if batch:
+            self.write_batch(batch)
+        # bulk-операции не шлют сигналы — сбрасываем кэши каталога один раз в конце
+        bump_generation('products')
+        bump_generation('categories')
+        invalidate_index()
+        return self
+
+    @staticmethod
+    def invalidate_products(pks):
+        for pk in pks:
+            bump_generation(f'product:{pk}')
+        invalidate_product_rows(*pks)
+        purge_pages(*[reverse('catalog:product_detail', args=[pk]) for pk in pks])
+
+    def build_product(self, row):
+        name = (row.get('name') or '').strip()
+        category_name = (row.get('category') or '').strip()
+        try:
+            price = Decimal(str(row.get('price')))
+        except (InvalidOperation, ValueError):
+            return None
+        if not name or not category_name:
+            return None
+        product = Product(
+            name=name,
+            description=row.get('description') or Product._meta.get_field('description').default,
+            price=price,
+            available=parse_bool(row.get('available'), True),
+            is_published=parse_bool(row.get('is_published'), False),
+            owner=self.owner,
+        )
+        product.category_name = category_name
+        return product
+
+    def resolve_categories(self, batch):
+        missing = {product.category_name for product in batch} - self.categories.keys()
+        if missing:
+            created = Category.objects.bulk_create([Category(name=name) for name in sorted(missing)])
+            self.categories.update((category.name, category.pk) for category in created if category.pk)
+            if missing - self.categories.keys():
+                # СУБД без RETURNING не вернула id — дочитываем
+                self.categories.update(Category.objects.filter(name__in=missing).values_list('name', 'pk'))
+        for product in batch:
+            product.category_id = self.categories[product.category_name]
+
+    def write_batch(self, batch):
+        with transaction.atomic():
+            self.resolve_categories(batch)
+            existing = {}
+            if self.upsert:
+                # Естественный ключ товара — (категория, название)
+                existing = {
+                    (category_id, name): pk
+                    for pk, category_id, name in Product.objects.filter(
+                        name__in={product.name for product in batch},
+                        category_id__in={product.category_id for product in batch},
+                    ).values_list('pk', 'category_id', 'name')
+                }
+            to_update, to_create = [], []
+            for product in batch:
+                product.pk = existing.get((product.category_id, product.name))
+                (to_update if product.pk else to_create).append(product)
+
+            created = Product.objects.bulk_create(to_create)
+            if to_update:
+                Product.objects.bulk_update(to_update, PRODUCT_FIELDS)
+            pks = [product.pk for product in created if product.pk] + [product.pk for product in to_update]
+            update_search_vectors(Product.objects.filter(pk__in=pks))
+
+        # Пакет уже закоммичен; bulk_update не шлёт post_save, поэтому карточки и страницы товаров сбрасываем сами.
+        # У новых строк кэша ещё нет — списки и счётчики сбросит bump_generation('products') в конце импорта
+        self.invalidate_products([product.pk for product in to_update])
+        self.created += len(to_create)
+        self.updated += len(to_update)
+        if self.progress:
+            self.progress(self)
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.benchmarks import percentile
+
+MODES = (('sync', '0'), ('async', '1'))
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает синхронные и async-представления каталога под uvicorn при высокой конкурентности'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paths', nargs='+', default=['/', '/product/', '/categories/', '/blog/'])
+        parser.add_argument('--concurrency', type=int, default=100)
+        parser.add_argument('--requests', type=int, default=2000, help='Запросов на каждый адрес')
+        parser.add_argument('--workers', type=int, default=1, help='Процессов uvicorn')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--output', help='Записать результат в JSON-файл')
+
+    def handle(self, *args, **options):
+        try:
+            import httpx  # noqa: F401
+            import uvicorn  # noqa: F401
+        except ImportError:
+            raise CommandError('Для бенчмарка нужны пакеты httpx и uvicorn')
+
+        # Сервер работает с базой и кэшем из текущих настроек — наполните их заранее (populate_db, import_catalog)
+        results = {}
+        for mode, flag in MODES:
+            with self.server(flag, options['port'], options['workers']) as base_url:
+                results[mode] = asyncio.run(
+                    self.load(base_url, options['paths'], options['requests'], options['concurrency'])
+                )
+
+        for path in options['paths']:
+            self.stdout.write(self.style.MIGRATE_HEADING(path))
+            for mode, _ in MODES:
+                row = results[mode][path]
+                self.stdout.write(
+                    f'  {mode:5} {row["rps"]:>8.1f} rps  p50 {row["p50_ms"]:>7.1f}  p99 {row["p99_ms"]:>7.1f} мс'
+                    f'  ошибок {row["errors"]}'
+                )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(results, output, indent=2, sort_keys=True)
+
+    @contextmanager
+    def server(self, async_views, port, workers):
+        env = {**os.environ, 'CATALOG_ASYNC_VIEWS': async_views}
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'myshop.asgi:application', '--port', str(port),
+             '--workers', str(workers), '--no-access-log', '--log-level', 'warning'],
+            env=env,
+        )
+        try:
+            self.wait_until_ready(f'http://127.0.0.1:{port}/')
+            yield f'http://127.0.0.1:{port}'
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    @staticmethod
+    def wait_until_ready(url, timeout=30):
+        import httpx
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                httpx.get(url, timeout=1)
+                return
+            except httpx.TransportError:
+                time.sleep(0.2)
+        raise CommandError(f'uvicorn не ответил на {url} за {timeout} с')
+
+    @staticmethod
+    async def load(base_url, paths, requests, concurrency):
+        import httpx
+
+        results = {}
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+            for path in paths:
+                timings, errors = [], 0
+                queue = iter(range(requests))
+
+                async def worker():
+                    nonlocal errors
+                    for _ in queue:
+                        started = time.perf_counter()
+                        try:
+                            response = await client.get(path)
+                            if response.status_code != 200:
+                                errors += 1
+                        except httpx.HTTPError:
+                            errors += 1
+                        timings.append((time.perf_counter() - started) * 1000)
+
+                started = time.perf_counter()
+                await asyncio.gather(*(worker() for _ in range(concurrency)))
+                elapsed = time.perf_counter() - started
+                results[path] = {
+                    'rps': requests / elapsed,
+                    'p50_ms': percentile(timings, 0.5),
+                    'p90_ms': percentile(timings, 0.9),
+                    'p99_ms': percentile(timings, 0.99),
+                    'errors': errors,
+                }
+        return results
@@ -0,0 +1,58 @@
+import time
+from decimal import Decimal
+from itertools import count
+
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+from catalog.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает время рендера главной страницы с холодным и тёплым кэшем карточек товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def build_products(self, cards):
+        # Товары не сохраняются в БД: измеряется только рендер шаблона
+        category = Category(pk=1, name='Бенчмарк')
+        products = []
+        for pk in range(1, cards + 1):
+            product = Product(
+                pk=pk, name=f'Товар {pk}', description='Описание товара ' * 10, price=Decimal('999.99'),
+                category=category, image=f'products/{pk}.webp',
+            )
+            product.current_versions = []
+            products.append(product)
+        return products
+
+    def render(self, products, generation):
+        for product in products:
+            product.cache_generation = generation
+        page = Paginator(products, len(products)).page(1)
+        request = RequestFactory().get('/')
+        context = {'products': products, 'page_obj': page, 'paginator': page.paginator, 'query': ''}
+        started = time.perf_counter()
+        render_to_string('catalog/homepage.html', context, request=request)
+        return time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        products = self.build_products(options['cards'])
+        generations = count(int(time.time() * 1000))
+        cold, warm = [], []
+        for _ in range(options['repeat']):
+            # Новое поколение — промах по всем карточкам, повтор с тем же поколением — попадание
+            generation = f'bench-{next(generations)}'
+            cold.append(self.render(products, generation))
+            warm.append(self.render(products, generation))
+
+        cold_ms = min(cold) * 1000
+        warm_ms = min(warm) * 1000
+        self.stdout.write(f'Карточек: {options["cards"]}')
+        self.stdout.write(f'Холодный кэш: {cold_ms:.2f} мс')
+        self.stdout.write(f'Тёплый кэш: {warm_ms:.2f} мс')
+        self.stdout.write(self.style.SUCCESS(f'Ускорение: {cold_ms / warm_ms:.1f}x'))
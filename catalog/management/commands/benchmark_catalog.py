@@ -0,0 +1,73 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+
+from catalog.benchmarks import run_benchmarks, seed_catalog
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'}}
+
+
+class Command(BaseCommand):
+    help = 'Наполняет отдельную тестовую БД синтетическим каталогом и измеряет задержки, запросы и объём ответов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--versions', type=int, default=2, help='Версий на товар')
+        parser.add_argument('--blog-posts', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--requests', type=int, default=50, help='Замеров на каждый адрес')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--cold', action='store_true', help='Очищать кэш перед каждым запросом')
+        parser.add_argument('--cache', choices=['locmem', 'default'], default='locmem',
+                            help='locmem — локальный кэш процесса, default — кэш из настроек (Redis)')
+        parser.add_argument('--output', help='Записать результат в JSON-файл')
+        parser.add_argument('--compare', help='JSON предыдущего запуска для сравнения')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        # Данные создаются в тестовой БД (для SQLite — в памяти), рабочая база не затрагивается
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(CACHES=LOCMEM_CACHES if options['cache'] == 'locmem' else settings.CACHES):
+                seed_catalog(options['products'], options['categories'], options['versions'],
+                             options['blog_posts'], seed=options['seed'])
+                results = run_benchmarks(requests=options['requests'], warmup=options['warmup'],
+                                         cold=options['cold'])
+                cache_backend = settings.CACHES['default']['BACKEND']
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'environment': {'database': connection.vendor, 'cache': cache_backend, 'cold_cache': options['cold']},
+            'dataset': {key: options[key] for key in ('products', 'categories', 'versions', 'blog_posts', 'seed')},
+            'endpoints': results,
+        }
+        payload = json.dumps(report, indent=2, sort_keys=True, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.write(payload + '\n')
+        else:
+            self.stdout.write(payload)
+
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as baseline_file:
+                self.write_comparison(json.load(baseline_file)['endpoints'], results)
+
+    def write_comparison(self, baseline, results):
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            p50_before, p50_after = before['latency_ms']['p50'], result['latency_ms']['p50']
+            change = (p50_after - p50_before) / p50_before * 100 if p50_before else 0.0
+            queries = result['queries']['mean'] - before['queries']['mean']
+            line = f'{name}: p50 {p50_before:.2f} → {p50_after:.2f} мс ({change:+.0f}%), запросов {queries:+.1f}'
+            style = self.style.WARNING if change > 10 or queries > 0 else self.style.SUCCESS
+            self.stderr.write(style(line))
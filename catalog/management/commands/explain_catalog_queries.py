@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from catalog.models import Product, Version
+from catalog.services import blogpost_listing_queryset, product_listing_queryset
+
+
+def canonical_queries(page_size=10):
+    product_ids = list(product_listing_queryset().values_list('pk', flat=True)[:page_size]) or [0]
+    return [
+        ('Лента товаров', product_listing_queryset()[:page_size], 'catalog_product_created_idx'),
+        ('Опубликованные товары', Product.objects.published().order_by('-created_at', '-pk')[:page_size],
+         'catalog_product_published_idx'),
+        ('Текущие версии страницы', Version.objects.filter(is_current=True, product_id__in=product_ids),
+         'catalog_version_one_current'),
+        ('Лента блога', blogpost_listing_queryset()[:page_size], 'catalog_blogpost_published_idx'),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Выполняет EXPLAIN (ANALYZE на PostgreSQL) для основных запросов каталога и проверяет использование индексов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--no-analyze', action='store_true',
+                            help='Только план, без выполнения запроса')
+
+    def handle(self, *args, **options):
+        # На SQLite доступен только EXPLAIN QUERY PLAN
+        options_for_vendor = {}
+        if connection.vendor == 'postgresql':
+            options_for_vendor = {'analyze': not options['no_analyze'], 'buffers': not options['no_analyze']}
+
+        missing = 0
+        for label, queryset, index_name in canonical_queries(options['page_size']):
+            plan = queryset.explain(**options_for_vendor)
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write(plan)
+            if index_name in plan:
+                self.stdout.write(self.style.SUCCESS(f'Используется индекс {index_name}\n'))
+            else:
+                missing += 1
+                # На почти пустых таблицах планировщик законно предпочитает последовательное чтение
+                self.stdout.write(self.style.WARNING(f'Индекс {index_name} не используется\n'))
+        if missing:
+            self.stdout.write(self.style.WARNING(f'Запросов без ожидаемого индекса: {missing}'))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalog.services import flush_blogpost_views
+
+
+class Command(BaseCommand):
+    help = 'Переносит накопленные в Redis просмотры блога в BlogPost.view_count'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять сброс каждые N секунд (0 — выполнить один раз)')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            flushed = flush_blogpost_views()
+            self.stdout.write(self.style.SUCCESS(f'Записано просмотров: {flushed}'))
+            if not interval:
+                break
+            time.sleep(interval)
@@ -0,0 +1,48 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.importers import READERS, CatalogImporter
+
+
+def resolve_owner(email):
+    User = get_user_model()
+    owner = User.objects.filter(email=email).first() if email else User.objects.filter(is_superuser=True).first()
+    if owner is None:
+        raise CommandError('Не найден владелец товаров: укажите --owner или создайте суперпользователя')
+    return owner
+
+
+def report_progress(stdout):
+    def report(importer):
+        stdout.write(
+            f'создано: {importer.created}, обновлено: {importer.updated}, пропущено: {importer.skipped}, '
+            f'{importer.rows_per_second:.0f} строк/с'
+        )
+    return report
+
+
+class Command(BaseCommand):
+    help = 'Потоково импортирует товары из JSON Lines / CSV / JSON пакетами через bulk_create'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(READERS), help='По умолчанию — по расширению файла')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--upsert', action='store_true', help='Обновлять товары с тем же названием и категорией')
+        parser.add_argument('--owner', help='Email владельца импортируемых товаров')
+
+    def handle(self, *args, **options):
+        importer = CatalogImporter(
+            owner=resolve_owner(options['owner']),
+            batch_size=options['batch_size'],
+            upsert=options['upsert'],
+            progress=report_progress(self.stdout),
+        )
+        try:
+            importer.import_file(options['path'], options['format'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f'Импорт завершён: создано {importer.created}, обновлено {importer.updated}, '
+            f'пропущено {importer.skipped} ({importer.rows_per_second:.0f} строк/с)'
+        ))
@@ -1,37 +1,38 @@
-import os
-import json
 from django.core.management.base import BaseCommand
+
+from catalog.importers import CatalogImporter, iter_json_array
+from catalog.management.commands.import_catalog import report_progress, resolve_owner
 from catalog.models import Product, Category
 
+
+def fixture_rows(stream, importer):
+    # Фикстура ссылается на категории по pk — переводим в имена для импортёра
+    categories = {}
+    for item in iter_json_array(stream):
+        fields = item['fields']
+        if item['model'] == 'catalog.category':
+            category = Category.objects.create(**fields)
+            categories[item['pk']] = category.name
+            importer.categories[category.name] = category.pk
+        elif item['model'] == 'catalog.product':
+            yield {**fields, 'category': categories[fields['category']]}
+
+
 class Command(BaseCommand):
     help = 'Очищает базу данных и заполняет её данными из фикстуры'
 
-    def load_fixtures(self, file_path):
-        abs_path = os.path.join(os.getcwd(), file_path)
-        with open(abs_path, 'rb') as f:
-            raw_data = f.read()
-            print(raw_data)
-        return json.loads(raw_data.decode('utf-8'))
+    def add_arguments(self, parser):
+        parser.add_argument('--fixture', default='catalog/fixtures/catalog_data.json')
+        parser.add_argument('--owner', help='Email владельца товаров (по умолчанию — первый суперпользователь)')
+        parser.add_argument('--batch-size', type=int, default=1000)
 
-    def handle(self, *args, **kwargs):
+    def handle(self, *args, **options):
+        owner = resolve_owner(options['owner'])
         Product.objects.all().delete()
         Category.objects.all().delete()
 
-        data = self.load_fixtures('catalog/fixtures/catalog_data.json')
-
-        for item in data:
-            model = item['model']
-            fields = item['fields']
-            if model == 'catalog.category':
-                Category.objects.create(**fields)
-            elif model == 'catalog.product':
-                category = Category.objects.get(pk=fields['category'])
-                Product.objects.create(
-                    name=fields['name'],
-                    description=fields['description'],
-                    price=fields['price'],
-                    category=category,
-                    available=fields['available']
-                )
+        importer = CatalogImporter(owner, batch_size=options['batch_size'], progress=report_progress(self.stdout))
+        with open(options['fixture'], encoding='utf-8') as stream:
+            importer.import_rows(fixture_rows(stream, importer))
 
         self.stdout.write(self.style.SUCCESS('База данных успешно заполнена!'))
@@ -0,0 +1,44 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from myshop.instrumentation import aggregator, load_view_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает сводку RequestInstrumentationMiddleware по представлениям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Вывести в JSON вместе с гистограммами')
+        parser.add_argument('--sort', choices=['count', 'p99_ms', 'queries', 'db_ms'], default='p99_ms')
+        parser.add_argument('--reset', action='store_true', help='Обнулить накопленную статистику')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            aggregator.reset()
+            self.stdout.write(self.style.SUCCESS('Статистика запросов очищена'))
+            return
+
+        stats = load_view_stats()
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2, sort_keys=True, ensure_ascii=False))
+            return
+        if not stats:
+            self.stdout.write('Статистики пока нет')
+            return
+
+        self.stdout.write(f'{"Представление":40} {"Запросов":>9} {"p50":>7} {"p90":>7} {"p99":>7} '
+                          f'{"SQL":>6} {"БД, мс":>8} {"Шаблон":>8} {"Кэш":>6} {"Бюджет":>7}')
+        ordered = sorted(stats.items(), key=lambda item: item[1][options['sort']] or 0, reverse=True)
+        for view, row in ordered:
+            ratio = f'{row["cache_hit_ratio"]:.0%}' if row['cache_hit_ratio'] is not None else '-'
+            self.stdout.write(
+                f'{view[:40]:40} {row["count"]:>9} {self.bound(row["p50_ms"])} {self.bound(row["p90_ms"])} '
+                f'{self.bound(row["p99_ms"])} {row["queries"]:>6.1f} {row["db_ms"]:>8.1f} '
+                f'{row["template_ms"]:>8.1f} {ratio:>6} {row["over_budget"]:>7}'
+            )
+        self.stdout.write('Перцентили — верхние границы корзин гистограммы, мс')
+
+    @staticmethod
+    def bound(value):
+        return f'{">5000" if value == float("inf") else value:>7}'
@@ -0,0 +1,130 @@
+import hashlib
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+REVALIDATE_MAX_AGE = 60 * 60
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+STREAM_CHUNK_SIZE = 64 * 1024
+# Имена с хэшем содержимого: производные изображения и файлы ManifestStaticFilesStorage
+HASHED_NAME_RE = re.compile(r'(^derivatives/)|(\.[0-9a-f]{12}\.[^/.]+$)')
+
+_fingerprints = {}
+
+
+def file_fingerprint(path):
+    # Хэш содержимого считается один раз на (mtime, размер) файла
+    stat = os.stat(path)
+    signature = (path, stat.st_mtime_ns, stat.st_size)
+    fingerprint = _fingerprints.get(signature)
+    if fingerprint is None:
+        cache_key = 'media_fingerprint:' + hashlib.sha1(repr(signature).encode()).hexdigest()
+        fingerprint = cache.get(cache_key)
+        if fingerprint is None:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            fingerprint = digest.hexdigest()[:16]
+            cache.set(cache_key, fingerprint, None)
+        _fingerprints[signature] = fingerprint
+    return fingerprint
+
+
+def media_fingerprint(name):
+    try:
+        return file_fingerprint(safe_join(str(settings.MEDIA_ROOT), str(name)))
+    except (OSError, SuspiciousFileOperation):
+        return None
+
+
+def _range_response(path, size, header):
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    else:
+        start, end = max(0, size - int(end)), size - 1
+    if start > end or start >= size:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    def chunks():
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining:
+                data = f.read(min(STREAM_CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+    response = StreamingHttpResponse(chunks(), status=206)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(end - start + 1)
+    return response
+
+
+def serve_file(request, path, document_root):
+    try:
+        full_path = safe_join(str(document_root), path)
+    except SuspiciousFileOperation:
+        raise Http404('Файл не найден')
+    if not os.path.isfile(full_path):
+        raise Http404('Файл не найден')
+
+    fingerprint = file_fingerprint(full_path)
+    etag = f'"{fingerprint}"'
+    immutable = HASHED_NAME_RE.search(path) or request.GET.get('v') == fingerprint
+    cache_control = (
+        f'public, max-age={IMMUTABLE_MAX_AGE}, immutable' if immutable
+        else f'public, max-age={REVALIDATE_MAX_AGE}'
+    )
+
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+    elif settings.MEDIA_ACCEL_REDIRECT_PREFIX:
+        # Отдачу файла берёт на себя nginx (sendfile), Django только проверяет путь и ставит заголовки
+        response = HttpResponse(content_type=mimetypes.guess_type(full_path)[0] or 'application/octet-stream')
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + path
+    else:
+        size = os.path.getsize(full_path)
+        range_header = request.headers.get('Range')
+        if_range = request.headers.get('If-Range')
+        response = None
+        if range_header and (not if_range or if_range == etag):
+            response = _range_response(full_path, size, range_header)
+            if response is not None and response.status_code == 206:
+                response['Content-Type'] = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+        if response is None:
+            # FileResponse отдаёт файл через wsgi.file_wrapper — sendfile без копирования в Python
+            response = FileResponse(open(full_path, 'rb'))
+        response['Accept-Ranges'] = 'bytes'
+        response['Last-Modified'] = http_date(os.path.getmtime(full_path))
+
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    return serve_file(request, path, settings.MEDIA_ROOT)
+
+
+@require_safe
+def serve_static(request, path):
+    return serve_file(request, path, settings.STATIC_ROOT)
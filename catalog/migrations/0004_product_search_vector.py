@@ -0,0 +1,46 @@
+# Generated by Django 5.0.6 on 2026-10-18 18:51
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_CONFIG = 'russian'
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX catalog_product_search_vector_gin ON catalog_product USING gin (search_vector)'
+    )
+    schema_editor.execute(
+        f"""
+        UPDATE catalog_product AS p SET search_vector =
+            setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(p.name, '')), 'A') ||
+            setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(p.description, '')), 'B') ||
+            setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(c.name, '')), 'C')
+        FROM catalog_category AS c
+        WHERE c.id = p.category_id
+        """
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS catalog_product_search_vector_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_alter_product_manufactured_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
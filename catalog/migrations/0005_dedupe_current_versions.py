@@ -0,0 +1,28 @@
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def keep_latest_current_version(apps, schema_editor):
+    # Перед уникальным ограничением оставляем у каждого продукта одну текущую версию — последнюю добавленную
+    Version = apps.get_model('catalog', 'Version')
+    duplicates = (
+        Version.objects.filter(is_current=True)
+        .values('product_id')
+        .annotate(total=Count('id'), keep_id=Max('id'))
+        .filter(total__gt=1)
+    )
+    for row in duplicates.iterator():
+        Version.objects.filter(product_id=row['product_id'], is_current=True).exclude(
+            pk=row['keep_id']
+        ).update(is_current=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(keep_latest_current_version, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,15 @@
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.dispatch import Signal
 from django.utils.text import slugify
 from datetime import datetime
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+# Version.make_current() меняет флаги через UPDATE, без post_save — кэши сбрасываются по этому сигналу
+current_version_changed = Signal()
+
 
 class BlogPost(models.Model):
     title = models.CharField(max_length=255)
@@ -15,6 +20,15 @@ class BlogPost(models.Model):
     is_published = models.BooleanField(default=False)
     view_count = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            # Лента блога: только опубликованные посты, новые сверху
+            models.Index(
+                fields=['-created_at', '-id'], condition=models.Q(is_published=True),
+                name='catalog_blogpost_published_idx',
+            ),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.title)
@@ -37,6 +51,21 @@ class Category(models.Model):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    def published(self):
+        return self.filter(is_published=True)
+
+    def with_current_version(self):
+        # Текущая версия подгружается одним запросом на всю выборку
+        return self.prefetch_related(
+            models.Prefetch(
+                'versions',
+                queryset=Version.objects.filter(is_current=True),
+                to_attr='current_versions',
+            )
+        )
+
+
 class Product(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(default="Default description")
@@ -48,8 +77,20 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='products')
     is_published = models.BooleanField(default=False, verbose_name='Опубликован')
+    # Заполняется сигналом (см. catalog.search), GIN-индекс создаётся миграцией только на PostgreSQL
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
+        indexes = [
+            # Порядок ленты товаров (product_listing_queryset) и его опубликованная часть
+            models.Index(fields=['-created_at', '-id'], name='catalog_product_created_idx'),
+            models.Index(
+                fields=['-created_at', '-id'], condition=models.Q(is_published=True),
+                name='catalog_product_published_idx',
+            ),
+        ]
         permissions = [
             ("can_unpublish_product", "Может отменять публикацию продукта"),
             ("can_change_any_description", "Может менять описание любого продукта"),
@@ -59,6 +100,13 @@ class Product(models.Model):
     def __str__(self):
         return self.name
 
+    @property
+    def current_version(self):
+        if hasattr(self, 'current_versions'):
+            return self.current_versions[0] if self.current_versions else None
+        # Частичный уникальный индекс гарантирует не больше одной строки
+        return self.versions.filter(is_current=True).order_by().first()
+
 
 class Version(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='versions', verbose_name='Продукт')
@@ -70,10 +118,30 @@ class Version(models.Model):
         verbose_name = 'Версия'
         verbose_name_plural = 'Версии'
         ordering = ['-is_current', '-version_number']
+        constraints = [
+            # Частичный уникальный индекс: не больше одной текущей версии у продукта,
+            # он же обслуживает выборку текущих версий по product_id
+            models.UniqueConstraint(
+                fields=['product'], condition=models.Q(is_current=True), name='catalog_version_one_current',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.version_name} ({self.version_number})"
 
+    def make_current(self):
+        with transaction.atomic():
+            # Блокировка строки продукта сериализует одновременные переключения.
+            # Ограничение не может быть отложенным, поэтому сначала снимаем флаг со старой версии
+            list(Product.objects.select_for_update().filter(pk=self.product_id).values_list('pk', flat=True))
+            Version.objects.filter(product_id=self.product_id, is_current=True).exclude(pk=self.pk).update(
+                is_current=False
+            )
+            Version.objects.filter(pk=self.pk, is_current=False).update(is_current=True)
+            self.is_current = True
+            # Сигнал после коммита: до него параллельный читатель закэшировал бы старую версию под новым поколением
+            transaction.on_commit(lambda: current_version_changed.send(sender=Version, version=self))
+
 
 class ContactInfo(models.Model):
     phone = models.CharField(max_length=20, verbose_name='Телефон')
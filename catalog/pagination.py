@@ -0,0 +1,126 @@
+import collections.abc
+import json
+import math
+from datetime import datetime
+
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from catalog.services import PRODUCT_PAGE_MAX_SIZE, get_product_count, get_product_page_ids, get_products_by_ids
+
+
+# Страница собирается из кэша: список id страницы + строки товаров через get_many
+class CachedProductPaginator(Paginator):
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True):
+        super().__init__(object_list, min(int(per_page), PRODUCT_PAGE_MAX_SIZE), 0, allow_empty_first_page)
+
+    @cached_property
+    def count(self):
+        return get_product_count()
+
+    def page(self, number):
+        number = self.validate_number(number)
+        ids = get_product_page_ids(number, self.per_page)
+        return self._get_page(get_products_by_ids(ids), number, self)
+
+
+class KeysetPaginator:
+    # Курсорная пагинация по (created_at, id) по убыванию: без COUNT(*) и OFFSET на каждый запрос.
+    # Общее число записей берётся из count() — кэшированного или оценочного
+
+    def __init__(self, queryset, per_page, count=None):
+        self.queryset = queryset.order_by('-created_at', '-pk')
+        self.per_page = int(per_page)
+        self._count = count
+
+    @cached_property
+    def count(self):
+        if self._count is not None:
+            return self._count()
+        return self.queryset.count()
+
+    @cached_property
+    def num_pages(self):
+        return max(1, math.ceil(self.count / self.per_page))
+
+    def page(self, cursor=None):
+        if not cursor:
+            return self._forward(None, 1)
+        created_at, pk, direction, number = decode_cursor(cursor)
+        if direction == 'prev':
+            return self._backward(created_at, pk, number)
+        return self._forward((created_at, pk), number)
+
+    def _forward(self, after, number):
+        queryset = self.queryset
+        if after is not None:
+            created_at, pk = after
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+        items = list(queryset[:self.per_page + 1])
+        has_next = len(items) > self.per_page
+        return KeysetPage(items[:self.per_page], number, self, has_next=has_next, has_previous=number > 1)
+
+    def _backward(self, created_at, pk, number):
+        queryset = self.queryset.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+        ).order_by('created_at', 'pk')
+        items = list(queryset[:self.per_page + 1])
+        has_previous = len(items) > self.per_page
+        items = items[:self.per_page][::-1]
+        return KeysetPage(items, max(number, 1), self, has_next=True, has_previous=has_previous)
+
+
+class KeysetPage(collections.abc.Sequence):
+    is_keyset = True
+
+    def __init__(self, object_list, number, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<Keyset page {self.number}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next and bool(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous and bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def next_cursor(self):
+        if not self.has_next():
+            return None
+        return encode_cursor(self.object_list[-1], 'next', self.number + 1)
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous():
+            return None
+        return encode_cursor(self.object_list[0], 'prev', self.number - 1)
+
+
+def encode_cursor(obj, direction, number):
+    payload = json.dumps([obj.created_at.isoformat(), obj.pk, direction, number], separators=(',', ':'))
+    return urlsafe_base64_encode(payload.encode())
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, pk, direction, number = json.loads(urlsafe_base64_decode(cursor))
+        return datetime.fromisoformat(created_at), int(pk), direction, int(number)
+    except (TypeError, ValueError):
+        raise InvalidPage('Некорректный курсор страницы')
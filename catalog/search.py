@@ -0,0 +1,62 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connections, router
+from django.db.models import F, OuterRef, Subquery
+
+from catalog.models import Category, Product
+
+SEARCH_CONFIG = 'russian'
+TOKEN_RE = re.compile(r'\w+')
+
+
+def uses_postgres_search():
+    return connections[router.db_for_read(Product)].vendor == 'postgresql'
+
+
+def product_search_vector():
+    category_name = Subquery(Category.objects.filter(pk=OuterRef('category_id')).order_by().values('name')[:1])
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+        + SearchVector(category_name, weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(queryset):
+    if uses_postgres_search():
+        queryset.update(search_vector=product_search_vector())
+
+
+def _tokens(query):
+    return TOKEN_RE.findall(query.lower())
+
+
+def _postgres_search(queryset, tokens):
+    # Каждое слово ищется по префиксу: «смартф» найдёт «смартфон»
+    search_query = SearchQuery(' & '.join(f'{token}:*' for token in tokens), search_type='raw', config=SEARCH_CONFIG)
+    return queryset.filter(search_vector=search_query).annotate(
+        rank=SearchRank(F('search_vector'), search_query)
+    ).order_by('-rank', '-created_at', '-pk')
+
+
+def _fallback_search(queryset, tokens):
+    # Запасной вариант для SQLite в тестах: LIKE в SQLite не понимает регистр кириллицы,
+    # поэтому сравниваем в Python — это последовательный просмотр, годится только для малых баз
+    rows = queryset.values_list('pk', 'name', 'description', 'category__name')
+    matched = [
+        pk for pk, *fields in rows
+        if all(any(token in (field or '').lower() for field in fields) for token in tokens)
+    ]
+    return queryset.filter(pk__in=matched).order_by('-created_at', '-pk')
+
+
+def search_products(query, queryset=None):
+    if queryset is None:
+        queryset = Product.objects.all()
+    tokens = _tokens(query)
+    if not tokens:
+        return queryset.none()
+    if uses_postgres_search():
+        return _postgres_search(queryset, tokens)
+    return _fallback_search(queryset, tokens)
@@ -1,23 +1,280 @@
+import math
+import random
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
 from django.core.cache import cache
-from catalog.models import Category, Product
+from django.db import connections, router, transaction
+from django.db.models import Case, F, PositiveIntegerField, When
+from catalog.models import BlogPost, Category, Product
+from myshop.metrics import key_family, record_cache_lookup
+from myshop.replicas import read_from_primary
 
+CACHE_TIMEOUT = 60 * 60 * 6
+CACHE_SOFT_TIMEOUT = 60 * 60
+LOCK_TIMEOUT = 30
+LOCK_WAIT_ATTEMPTS = 20
+LOCK_WAIT_INTERVAL = 0.05
+PAGE_CACHE_TIMEOUT = 60 * 15
+PRODUCT_PAGE_MAX_SIZE = 50
+VIEW_FLUSH_BATCH_SIZE = 500
+COUNT_ESTIMATE_THRESHOLD = 100_000
 
-def get_categories():
-    cache_key = 'categories_list'
-    categories = cache.get(cache_key)
+# value — данные, expires_at — логическое (мягкое) истечение, delta — сколько длился пересчёт
+CacheEntry = namedtuple('CacheEntry', ['value', 'expires_at', 'delta'])
+
+
+def _generation_key(namespace):
+    return f'generation:{namespace}'
+
+
+def _initial_generation():
+    # Отсчёт от текущего времени: если ключ поколения вытеснят из кэша,
+    # новое значение не совпадёт со старыми и устаревшие записи не вернутся
+    return int(time.time() * 1000)
+
+
+def get_generations(*namespaces):
+    keys = {namespace: _generation_key(namespace) for namespace in namespaces}
+    found = cache.get_many(keys.values())
+    generations = {}
+    for namespace, key in keys.items():
+        generation = found.get(key)
+        if generation is None:
+            generation = _initial_generation()
+            if not cache.add(key, generation, timeout=None):
+                generation = cache.get(key, generation)
+        generations[namespace] = generation
+    return generations
 
-    if not categories:
-        categories = list(Category.objects.all())
-        cache.set(cache_key, categories, timeout=900)
-    return categories
 
+def get_generation(namespace):
+    return get_generations(namespace)[namespace]
 
-def get_products():
-    cache_key = 'products_list'
-    products = cache.get(cache_key)
 
-    if not products:
-        products = list(Product.objects.all())
-        cache.set(cache_key, products, timeout=900)
+def bump_generation(namespace):
+    key = _generation_key(namespace)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_generation(), timeout=None)
+        return cache.incr(key)
 
+
+def attach_cache_generations(products):
+    # Поколение продукта — часть ключа кэша его карточки в шаблоне
+    generations = get_generations(*[f'product:{product.pk}' for product in products])
+    for product in products:
+        product.cache_generation = generations[f'product:{product.pk}']
     return products
+
+
+def versioned_key(key, *namespaces):
+    generations = get_generations(*namespaces)
+    suffix = '-'.join(str(generations[namespace]) for namespace in namespaces)
+    return f'{key}:g{suffix}'
+
+
+def product_cache_key(pk):
+    return versioned_key(f'product_{pk}', f'product:{pk}', 'categories')
+
+
+@contextmanager
+def single_flight(key, timeout=LOCK_TIMEOUT):
+    lock_key = f'{key}:lock'
+    if hasattr(cache, 'lock'):
+        # django_redis: блокировка Redis с токеном владельца
+        lock = cache.lock(lock_key, timeout=timeout)
+        acquired = lock.acquire(blocking=False)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                try:
+                    lock.release()
+                except Exception:
+                    # Блокировка уже истекла по таймауту
+                    pass
+    else:
+        acquired = cache.add(lock_key, 1, timeout)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                cache.delete(lock_key)
+
+
+def _load(key, loader, ttl, soft_ttl):
+    started = time.monotonic()
+    with read_from_primary():
+        value = loader()
+    delta = time.monotonic() - started
+    cache.set(key, CacheEntry(value, time.time() + soft_ttl, delta), timeout=ttl)
+    return value
+
+
+def _is_fresh(entry, beta):
+    # Вероятностное раннее обновление (XFetch): чем ближе истечение и дороже
+    # пересчёт, тем выше шанс, что этот запрос обновит значение заранее
+    jitter = entry.delta * beta * math.log(1.0 - random.random())
+    return time.time() - jitter < entry.expires_at
+
+
+def cached(key, loader, ttl=CACHE_TIMEOUT, soft_ttl=CACHE_SOFT_TIMEOUT, beta=1.0):
+    entry = cache.get(key)
+    hit = isinstance(entry, CacheEntry)
+    record_cache_lookup(key_family(key), hits=int(hit), misses=int(not hit))
+    if hit:
+        if _is_fresh(entry, beta):
+            return entry.value
+        with single_flight(key) as acquired:
+            if acquired:
+                return _load(key, loader, ttl, soft_ttl)
+        # Пересчётом уже занят другой воркер — отдаём устаревшее значение
+        return entry.value
+
+    with single_flight(key) as acquired:
+        if acquired:
+            return _load(key, loader, ttl, soft_ttl)
+
+    for _ in range(LOCK_WAIT_ATTEMPTS):
+        time.sleep(LOCK_WAIT_INTERVAL)
+        entry = cache.get(key)
+        if isinstance(entry, CacheEntry):
+            return entry.value
+    return _load(key, loader, ttl, soft_ttl)
+
+
+def page_cache_key(path):
+    return f'page:{path}'
+
+
+def purge_pages(*paths):
+    cache.delete_many([page_cache_key(path) for path in paths])
+
+
+def get_categories():
+    cache_key = versioned_key('categories_list', 'categories')
+    return cached(cache_key, lambda: list(Category.objects.all()))
+
+
+def product_listing_queryset():
+    return Product.objects.order_by('-created_at', '-pk')
+
+
+def product_row_key(pk):
+    return f'product_row:{pk}'
+
+
+def invalidate_product_rows(*pks):
+    cache.delete_many([product_row_key(pk) for pk in pks])
+
+
+def get_product_count():
+    cache_key = versioned_key('products_count', 'products')
+    return cached(cache_key, lambda: product_listing_queryset().count())
+
+
+def estimate_count(model):
+    # Оценка числа строк из статистики планировщика PostgreSQL (обновляется ANALYZE/autovacuum)
+    connection = connections[router.db_for_read(model)]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)', [model._meta.db_table])
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+def get_estimated_product_count():
+    # Для больших таблиц точный COUNT(*) ради «страница X из Y» не нужен — хватает оценки планировщика
+    estimate = cached('products_count_estimate', lambda: estimate_count(Product))
+    if estimate is not None and estimate >= COUNT_ESTIMATE_THRESHOLD:
+        return estimate
+    return get_product_count()
+
+
+def blogpost_listing_queryset():
+    return BlogPost.objects.filter(is_published=True).order_by('-created_at', '-pk')
+
+
+def get_blogpost_count():
+    cache_key = versioned_key('blogposts_count', 'blogposts')
+    return cached(cache_key, lambda: blogpost_listing_queryset().count())
+
+
+def get_product_page_ids(number, per_page):
+    # В кэше лежит только список id страницы — размер значения ограничен per_page
+    per_page = min(per_page, PRODUCT_PAGE_MAX_SIZE)
+    offset = (number - 1) * per_page
+    cache_key = versioned_key(f'products_page:{per_page}:{number}', 'products')
+    return cached(
+        cache_key,
+        lambda: list(product_listing_queryset().values_list('pk', flat=True)[offset:offset + per_page]),
+    )
+
+
+def get_products_by_ids(ids):
+    keys = {pk: product_row_key(pk) for pk in ids}
+    found = cache.get_many(keys.values())
+    rows = {pk: found[key] for pk, key in keys.items() if key in found}
+
+    missing = [pk for pk in ids if pk not in rows]
+    record_cache_lookup('product_row', hits=len(rows), misses=len(missing))
+    if missing:
+        with read_from_primary():
+            loaded = Product.objects.defer('search_vector').with_current_version().in_bulk(missing)
+        cache.set_many({keys[pk]: product for pk, product in loaded.items()}, timeout=CACHE_TIMEOUT)
+        rows.update(loaded)
+
+    return [rows[pk] for pk in ids if pk in rows]
+
+
+def blogpost_views_key(pk):
+    return f'blogpost_views:{pk}'
+
+
+def record_blogpost_view(pk):
+    # Просмотр — атомарный INCR в Redis вместо сохранения всей строки BlogPost
+    key = blogpost_views_key(pk)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_pending_views(pks):
+    keys = {pk: blogpost_views_key(pk) for pk in pks}
+    found = cache.get_many(keys.values())
+    return {pk: found[key] for pk, key in keys.items() if found.get(key)}
+
+
+def merge_pending_views(blogposts):
+    pending = get_pending_views([blogpost.pk for blogpost in blogposts])
+    for blogpost in blogposts:
+        blogpost.view_count += pending.get(blogpost.pk, 0)
+    return blogposts
+
+
+def flush_blogpost_views():
+    flushed = 0
+    pks = list(BlogPost.objects.values_list('pk', flat=True))
+    for start in range(0, len(pks), VIEW_FLUSH_BATCH_SIZE):
+        pending = get_pending_views(pks[start:start + VIEW_FLUSH_BATCH_SIZE])
+        if not pending:
+            continue
+        with transaction.atomic():
+            BlogPost.objects.filter(pk__in=pending).update(view_count=Case(
+                *[When(pk=pk, then=F('view_count') + count) for pk, count in pending.items()],
+                default=F('view_count'),
+                output_field=PositiveIntegerField(),
+            ))
+        # Вычитаем ровно записанное: просмотры, пришедшие во время сброса, остаются в счётчике
+        for pk, count in pending.items():
+            cache.decr(blogpost_views_key(pk), count)
+        flushed += sum(pending.values())
+    return flushed
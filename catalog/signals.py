@@ -0,0 +1,88 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.urls import reverse
+
+from catalog.autocomplete import record_change
+from catalog.images import schedule_derivatives
+from catalog.models import BlogPost, Category, Product, Version, current_version_changed
+from catalog.search import update_search_vectors
+from catalog.services import bump_generation, invalidate_product_rows, purge_pages
+
+# Кэш сбрасывается только после коммита. Если сдвинуть поколение раньше, параллельный запрос прочитает
+# ещё не изменённые данные и сохранит их под новым поколением на весь TTL
+
+
+def invalidate_product_caches(pk):
+    bump_generation('products')
+    bump_generation(f'product:{pk}')
+    invalidate_product_rows(pk)
+    purge_pages(reverse('catalog:product_detail', args=[pk]))
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_categories(sender, instance, **kwargs):
+    transaction.on_commit(lambda: bump_generation('categories'))
+
+
+@receiver(post_save, sender=Category)
+def update_category_products(sender, instance, created, **kwargs):
+    if created:
+        return
+    products = Product.objects.filter(category_id=instance.pk)
+    update_search_vectors(products)
+    paths = [reverse('catalog:product_detail', args=[pk]) for pk in products.values_list('pk', flat=True)]
+    transaction.on_commit(lambda: purge_pages(*paths))
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_vector(sender, instance, **kwargs):
+    update_search_vectors(Product.objects.filter(pk=instance.pk))
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: invalidate_product_caches(pk))
+
+
+@receiver(post_save, sender=Product)
+def update_autocomplete_on_save(sender, instance, **kwargs):
+    name = instance.name if instance.is_published else None
+    transaction.on_commit(lambda: record_change(instance.pk, name))
+
+
+@receiver(post_delete, sender=Product)
+def update_autocomplete_on_delete(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: record_change(pk, None))
+
+
+@receiver([post_save, post_delete], sender=Version)
+def invalidate_version(sender, instance, **kwargs):
+    product_id = instance.product_id
+    transaction.on_commit(lambda: invalidate_product_caches(product_id))
+
+
+@receiver(current_version_changed, sender=Version)
+def invalidate_current_version(sender, version, **kwargs):
+    # make_current шлёт сигнал уже после коммита
+    invalidate_product_caches(version.product_id)
+
+
+@receiver([post_save, post_delete], sender=BlogPost)
+def invalidate_blogpost(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: (bump_generation('blogposts'), bump_generation(f'blogpost:{pk}')))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=BlogPost)
+def process_uploaded_image(sender, instance, **kwargs):
+    if sender is Product:
+        image, namespace = instance.image, f'product:{instance.pk}'
+    else:
+        image, namespace = instance.preview_image, f'blogpost:{instance.pk}'
+    if image:
+        name = image.name
+        transaction.on_commit(lambda: schedule_derivatives(name, namespace))
@@ -1,10 +1,43 @@
 from django import template
 from django.conf import settings
 
+from catalog.images import get_derivatives
+from catalog.media import media_fingerprint
+
 register = template.Library()
 
 @register.filter
 def mymedia(path):
     if path:
+        # Версия по содержимому позволяет отдавать файл с вечным Cache-Control
+        fingerprint = media_fingerprint(path)
+        if fingerprint:
+            return f'{settings.MEDIA_URL}{path}?v={fingerprint}'
         return f'{settings.MEDIA_URL}{path}'
     return '#'
+
+
+@register.filter
+def media_srcset(image, fmt='webp'):
+    manifest = get_derivatives(getattr(image, 'name', image))
+    if not manifest or not manifest['variants'].get(fmt):
+        return ''
+    return ', '.join(f'{settings.MEDIA_URL}{path} {width}w' for width, path in manifest['variants'][fmt])
+
+
+@register.inclusion_tag('catalog/responsive_image.html')
+def responsive_image(image, alt='', sizes='(max-width: 640px) 100vw, 320px', css_class='card-img-top'):
+    manifest = get_derivatives(getattr(image, 'name', image))
+    sources = []
+    if manifest:
+        for fmt in ('avif', 'webp'):
+            if manifest['variants'].get(fmt):
+                sources.append({'type': f'image/{fmt}', 'srcset': media_srcset(image, fmt)})
+    return {
+        'src': mymedia(image),
+        'srcset': media_srcset(image, 'jpeg'),
+        'sources': sources,
+        'sizes': sizes,
+        'alt': alt,
+        'css_class': css_class,
+    }
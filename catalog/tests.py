@@ -1,10 +1,53 @@
+from asgiref.sync import async_to_sync
 from django.urls import reverse
 from .models import Product, Category, BlogPost, Version
 from django.contrib.auth import get_user_model
-from django.test import TestCase, Client
+from django.test import RequestFactory, TestCase, TransactionTestCase, Client, override_settings
 from django.contrib.auth.models import Group, Permission
-from catalog.services import get_categories
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+import asyncio
+import csv
+import gzip
+import importlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from PIL import Image
+from prometheus_client.parser import text_string_to_metric_families
+from django.core.files.uploadedfile import SimpleUploadedFile
+from catalog import async_views, autocomplete, benchmarks, images, media
+from catalog import urls as catalog_urls
+from catalog.async_cache import RedisAsyncCache
+from catalog.templatetags import media_tags
+from catalog.views import AnonymousPageCacheMixin
+from django_redis.client import DefaultClient
+from myshop import db, instrumentation, metrics, replicas
+from myshop import urls as myshop_urls
+from catalog.importers import CatalogImporter, iter_json_array
+from catalog.pagination import KeysetPaginator, decode_cursor
+from catalog.search import search_products
+from catalog.services import (
+    CacheEntry, PRODUCT_PAGE_MAX_SIZE, cached, flush_blogpost_views, get_categories, get_pending_views,
+    get_product_page_ids, get_products_by_ids, invalidate_product_rows, page_cache_key, product_row_key,
+    single_flight, versioned_key
+)
+from django.conf import settings
 from django.core.cache import cache
+from django.core.management import call_command
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, connection, connections, router, transaction
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.views import View
+from django.db.utils import ConnectionHandler
+from prometheus_client import REGISTRY
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches
+from django_redis.cache import RedisCache
 
 User = get_user_model()
 
@@ -74,20 +117,100 @@ class ProductPermissionsTests(TestCase):
         self.assertEqual(response.status_code, 302)
 
 
+class ProductPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(email='page@test.com', password='password123', username='page')
+        self.category = Category.objects.create(name='Категория')
+        self.product = Product.objects.create(
+            name='Продукт', price=10, category=self.category, owner=self.owner, is_published=True
+        )
+        self.version = Version.objects.create(product=self.product, version_number='1', version_name='Первая')
+        self.url = reverse('catalog:product_detail', args=[self.product.pk])
+
+    def test_anonymous_page_is_cached(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Продукт')
+        self.assertNotContains(response, 'Редактировать')
+
+    def test_owner_controls_are_not_cached_for_anonymous(self):
+        self.client.get(self.url)
+        self.client.login(email='page@test.com', password='password123')
+        self.assertContains(self.client.get(self.url), 'Редактировать')
+        self.client.logout()
+        self.assertNotContains(self.client.get(self.url), 'Редактировать')
+
+    def test_update_purges_cached_page(self):
+        self.client.get(self.url)
+        self.client.login(email='page@test.com', password='password123')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('catalog:update_product', args=[self.product.pk]), {
+                'name': 'Обновлённый', 'price': 20, 'category': self.category.pk, 'available': True
+            })
+        self.assertEqual(response.status_code, 302)
+        self.client.logout()
+        self.assertContains(self.client.get(self.url), 'Обновлённый')
+
+    def test_unpublish_purges_cached_page(self):
+        self.client.get(self.url)
+        moderator = User.objects.create_user(email='mod@test.com', password='password123', username='mod')
+        moderator.user_permissions.add(Permission.objects.get(codename='can_unpublish_product'))
+        self.client.login(email='mod@test.com', password='password123')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('catalog:unpublish_product', args=[self.product.pk]))
+        self.client.logout()
+        self.assertIsNone(cache.get(page_cache_key(self.url)))
+
+    def test_version_update_purges_cached_page(self):
+        self.client.get(self.url)
+        self.client.login(email='page@test.com', password='password123')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('catalog:update_version', args=[self.version.pk]), {
+                'product': self.product.pk, 'version_number': '2', 'version_name': 'Вторая', 'is_current': True
+            })
+        self.assertEqual(response.status_code, 302)
+        self.client.logout()
+        self.assertContains(self.client.get(self.url), 'Вторая')
+
+
 class CategoryServiceTests(TestCase):
     def setUp(self):
         # Создаем тестовые данные
-        Category.objects.create(name='Категория 1', description='Описание 1')
+        cache.clear()
+        self.category = Category.objects.create(name='Категория 1', description='Описание 1')
         Category.objects.create(name='Категория 2', description='Описание 2')
+        self.product = Product.objects.create(
+            name='Продукт',
+            description='Описание',
+            price=1000,
+            category=self.category,
+            owner=User.objects.create_user(
+                username='category_owner',
+                email='category_owner@test.com',
+                password='password123'
+            )
+        )
 
     def test_get_categories_caching(self):
         cache.clear()
         categories = get_categories()
         self.assertEqual(len(categories), 2)
-        Category.objects.all().delete()
-        cached_categories = get_categories()
+        with self.assertNumQueries(0):
+            cached_categories = get_categories()
         self.assertEqual(len(cached_categories), 2)
 
+    def test_get_categories_invalidated_on_write(self):
+        cache.clear()
+        self.assertEqual(len(get_categories()), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Категория 3')
+        self.assertEqual(len(get_categories()), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.filter(name='Категория 3').get().delete()
+        self.assertEqual(len(get_categories()), 2)
+
     def test_product_detail_view(self):
         response = self.client.get(reverse('catalog:product_detail', args=[self.product.pk]))
         self.assertEqual(response.status_code, 200)
@@ -99,24 +222,84 @@ class CategoryServiceTests(TestCase):
         self.assertContains(response, self.category.name)
 
     def test_category_list_caching(self):
-        # Ensure cache is clear
         cache.clear()
 
-        # Access category list view and cache data
         response = self.client.get(reverse('catalog:category_list'))
         self.assertEqual(response.status_code, 200)
 
-        # Add a new category after the cache is populated
-        Category.objects.create(name='New Category', description='New Description')
+        # Новая категория видна сразу: сигнал сдвигает поколение кэша
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='New Category', description='New Description')
+        updated_response = self.client.get(reverse('catalog:category_list'))
+        self.assertContains(updated_response, 'New Category')
+
+    def test_product_detail_cache_invalidated_on_write(self):
+        cache.clear()
+        url = reverse('catalog:product_detail', args=[self.product.pk])
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        self.product.name = 'Новое название'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertContains(self.client.get(url), 'Новое название')
 
-        # Fetch from the view again; data should come from cache
-        cached_response = self.client.get(reverse('catalog:category_list'))
-        self.assertNotContains(cached_response, 'New Category')
+        with self.captureOnCommitCallbacks(execute=True):
+            Version.objects.create(product=self.product, version_number='2', version_name='Свежая', is_current=True)
+        self.assertContains(self.client.get(url), 'Свежая')
 
-        # Clear the cache and fetch again; new category should appear
+        self.category.name = 'Переименованная'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.save()
+        self.assertContains(self.client.get(url), 'Переименованная')
+
+
+class CachedReadThroughTests(TestCase):
+    def setUp(self):
         cache.clear()
-        updated_response = self.client.get(reverse('catalog:category_list'))
-        self.assertContains(updated_response, 'New Category')
+        self.loader = mock.Mock(side_effect=lambda: self.loader.call_count)
+
+    def test_miss_loads_and_stores_entry(self):
+        self.assertEqual(cached('key', self.loader, ttl=60, soft_ttl=30), 1)
+        self.assertEqual(cached('key', self.loader, ttl=60, soft_ttl=30), 1)
+        self.assertEqual(self.loader.call_count, 1)
+        self.assertIsInstance(cache.get('key'), CacheEntry)
+
+    def test_none_values_are_cached(self):
+        loader = mock.Mock(return_value=None)
+        cached('none', loader)
+        cached('none', loader)
+        self.assertEqual(loader.call_count, 1)
+
+    def test_soft_expired_entry_is_refreshed(self):
+        cache.set('key', CacheEntry('old', 0, 0), 60)
+        self.assertEqual(cached('key', self.loader, ttl=60, soft_ttl=30), 1)
+        self.assertEqual(cache.get('key').value, 1)
+
+    def test_stale_value_served_while_another_worker_recomputes(self):
+        cache.set('key', CacheEntry('old', 0, 0), 60)
+        with single_flight('key') as acquired:
+            self.assertTrue(acquired)
+            self.assertEqual(cached('key', self.loader), 'old')
+        self.loader.assert_not_called()
+
+    @mock.patch('catalog.services.time.sleep')
+    def test_miss_waits_for_single_flight_owner(self, sleep):
+        def fill(_):
+            cache.set('key', CacheEntry('filled', float('inf'), 0), 60)
+
+        sleep.side_effect = fill
+        with single_flight('key'):
+            self.assertEqual(cached('key', self.loader), 'filled')
+        self.loader.assert_not_called()
+
+    def test_probabilistic_early_refresh(self):
+        expires_at = 1000.0
+        cache.set('key', CacheEntry('old', expires_at, 5.0), 60)
+        with mock.patch('catalog.services.time.time', return_value=expires_at - 1), \
+                mock.patch('catalog.services.random.random', return_value=0.99):
+            self.assertEqual(cached('key', self.loader), 1)
 
 
 class BlogPostTests(TestCase):
@@ -138,6 +321,33 @@ class BlogPostTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, self.blog_post.title)
 
+    def test_views_are_buffered_without_row_writes(self):
+        cache.clear()
+        url = reverse('catalog:blogpost_detail', args=[self.blog_post.pk])
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertFalse(any(q['sql'].startswith('UPDATE') for q in context.captured_queries))
+        self.assertContains(response, 'Просмотров: 1')
+        self.client.get(url)
+        self.blog_post.refresh_from_db()
+        self.assertEqual(self.blog_post.view_count, 0)
+        self.assertContains(self.client.get(reverse('catalog:blogpost_list')), 'Просмотров: 2')
+
+    def test_flush_moves_pending_views_to_database(self):
+        cache.clear()
+        url = reverse('catalog:blogpost_detail', args=[self.blog_post.pk])
+        for _ in range(3):
+            self.client.get(url)
+        self.assertEqual(flush_blogpost_views(), 3)
+        self.blog_post.refresh_from_db()
+        self.assertEqual(self.blog_post.view_count, 3)
+        self.assertEqual(get_pending_views([self.blog_post.pk]), {})
+        self.assertContains(self.client.get(url), 'Просмотров: 4')
+
+        call_command('flush_blog_views', stdout=StringIO())
+        self.blog_post.refresh_from_db()
+        self.assertEqual(self.blog_post.view_count, 4)
+
 
 class VersionTests(TestCase):
     def setUp(self):
@@ -168,3 +378,1078 @@ class VersionTests(TestCase):
         response = self.client.get(reverse('catalog:product_detail', args=[self.product.pk]))
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, self.version.version_name)
+
+    def test_make_current_switches_flag(self):
+        new_version = Version.objects.create(product=self.product, version_number='2.0', version_name='Вторая')
+        with CaptureQueriesContext(connection) as context:
+            new_version.make_current()
+        updates = [q for q in context.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(list(self.product.versions.filter(is_current=True)), [new_version])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).current_version, new_version)
+
+    def test_make_current_invalidates_only_after_commit(self):
+        new_version = Version.objects.create(product=self.product, version_number='2.0', version_name='Вторая')
+        generation_key = versioned_key('product', f'product:{self.product.pk}')
+        with self.captureOnCommitCallbacks() as callbacks:
+            new_version.make_current()
+            # До коммита поколение прежнее: читатель не сохранит под новым ключом старую версию
+            self.assertEqual(versioned_key('product', f'product:{self.product.pk}'), generation_key)
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertNotEqual(versioned_key('product', f'product:{self.product.pk}'), generation_key)
+
+    def test_version_form_creates_current_version(self):
+        self.client.login(email='owner_with_version@test.com', password='password123')
+        response = self.client.post(reverse('catalog:create_version'), {
+            'product': self.product.pk, 'version_number': '2.0', 'version_name': 'Новая', 'is_current': True
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.product.versions.get(is_current=True).version_name, 'Новая')
+        self.assertContains(self.client.get(reverse('catalog:homepage')), 'Новая')
+
+        response = self.client.post(reverse('catalog:update_version', args=[self.version.pk]), {
+            'product': self.product.pk, 'version_number': '1.0', 'version_name': 'Initial Version', 'is_current': True
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.product.versions.get(is_current=True), self.version)
+
+
+class ProductQueryCountTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            username='bulk_owner',
+            email='bulk_owner@test.com',
+            password='password123'
+        )
+        self.category = Category.objects.create(name='Категория')
+
+    def create_products(self, count):
+        for i in range(count):
+            product = Product.objects.create(
+                name=f'Продукт {i}',
+                price=100 + i,
+                category=self.category,
+                owner=self.owner,
+                is_published=True
+            )
+            Version.objects.create(product=product, version_number='1', version_name='Старая')
+            Version.objects.create(product=product, version_number='2', version_name=f'Текущая {i}', is_current=True)
+
+    def count_queries(self, url_name, *args):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse(url_name, args=args))
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response
+
+    def test_homepage_query_count_is_constant(self):
+        self.create_products(2)
+        few, _ = self.count_queries('catalog:homepage')
+        self.create_products(8)
+        many, response = self.count_queries('catalog:homepage')
+        self.assertEqual(few, many)
+        self.assertContains(response, 'Текущая 7')
+        self.assertNotContains(response, 'Старая')
+
+    def test_product_list_query_count_is_constant(self):
+        self.create_products(2)
+        few, _ = self.count_queries('catalog:product_list')
+        self.create_products(8)
+        many, _ = self.count_queries('catalog:product_list')
+        self.assertEqual(few, many)
+
+    def test_product_detail_loads_current_version(self):
+        self.create_products(1)
+        product = Product.objects.get()
+        queries, response = self.count_queries('catalog:product_detail', product.pk)
+        self.assertLessEqual(queries, 3)
+        self.assertContains(response, 'Текущая 0')
+        self.assertContains(response, self.category.name)
+
+    def test_homepage_warm_cache_hits_no_database(self):
+        self.create_products(5)
+        self.count_queries('catalog:homepage')
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('catalog:homepage'))
+        self.assertContains(response, 'Текущая 4')
+
+    def test_product_page_cache_sees_writes(self):
+        self.create_products(3)
+        self.count_queries('catalog:homepage')
+        product = Product.objects.get(name='Продукт 1')
+        product.name = 'Переименован'
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+            Product.objects.create(name='Новинка', price=1, category=self.category, owner=self.owner)
+        response = self.client.get(reverse('catalog:homepage'))
+        self.assertContains(response, 'Переименован')
+        self.assertContains(response, 'Новинка')
+
+    def test_product_card_fragment_follows_product_generation(self):
+        self.create_products(2)
+        self.count_queries('catalog:homepage')
+        product = Product.objects.get(name='Продукт 0')
+        invalidate_product_rows(product.pk)
+        Product.objects.filter(pk=product.pk).update(name='Без сигнала')
+        # update() не сдвигает поколение — карточка берётся из кэша фрагментов
+        self.assertNotContains(self.client.get(reverse('catalog:homepage')), 'Без сигнала')
+        product.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertContains(self.client.get(reverse('catalog:homepage')), 'Без сигнала')
+
+    def test_card_render_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_card_render', cards=5, repeat=2, stdout=out)
+        self.assertIn('Ускорение', out.getvalue())
+
+    def test_product_rows_are_cached_individually(self):
+        cache.clear()
+        self.create_products(3)
+        ids = get_product_page_ids(1, 10)
+        self.assertEqual(len(ids), 3)
+        self.assertEqual([p.pk for p in get_products_by_ids(ids)], ids)
+        self.assertIsNotNone(cache.get(product_row_key(ids[0])))
+        with self.assertNumQueries(0):
+            get_products_by_ids(ids)
+        self.assertLessEqual(len(get_product_page_ids(1, 1000)), PRODUCT_PAGE_MAX_SIZE)
+
+    def test_with_current_version_prefetch(self):
+        self.create_products(3)
+        with self.assertNumQueries(2):
+            versions = [p.current_version for p in Product.objects.with_current_version()]
+        self.assertTrue(all(v.is_current for v in versions))
+
+
+@override_settings(CATALOG_PAGINATION='keyset')
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user(username='keyset', email='keyset@test.com', password='password123')
+        category = Category.objects.create(name='Категория')
+        self.products = [
+            Product.objects.create(name=f'Товар {i:02d}', price=i, category=category, owner=owner)
+            for i in range(25)
+        ]
+
+    def test_paginator_walks_forward_and_back(self):
+        paginator = KeysetPaginator(Product.objects.all(), 10)
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        third = paginator.page(second.next_cursor)
+        seen = [p.pk for page in (first, second, third) for p in page]
+        self.assertEqual(seen, [p.pk for p in reversed(self.products)])
+        self.assertFalse(third.has_next())
+        self.assertEqual((third.number, paginator.num_pages), (3, 3))
+
+        back = paginator.page(third.previous_cursor)
+        self.assertEqual([p.pk for p in back], [p.pk for p in second])
+        self.assertEqual(back.number, 2)
+        self.assertTrue(back.has_previous())
+
+    def test_view_uses_cursor_without_offset(self):
+        response = self.client.get(reverse('catalog:homepage'))
+        cursor = response.context['page_obj'].next_cursor
+        self.assertEqual(decode_cursor(cursor)[3], 2)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('catalog:homepage'), {'page': cursor})
+        self.assertContains(response, 'Страница 2 из 3')
+        self.assertContains(response, 'Товар 14')
+        self.assertFalse(any('OFFSET' in q['sql'] or 'COUNT' in q['sql'] for q in context.captured_queries))
+
+    def test_invalid_cursor_returns_404(self):
+        response = self.client.get(reverse('catalog:homepage'), {'page': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_blog_list_supports_keyset(self):
+        for i in range(12):
+            BlogPost.objects.create(title=f'Пост {i}', slug=f'post-{i}', content='Текст', is_published=True)
+        response = self.client.get(reverse('catalog:blogpost_list'))
+        self.assertContains(response, 'Страница 1 из 2')
+        next_cursor = response.context['page_obj'].next_cursor
+        response = self.client.get(reverse('catalog:blogpost_list'), {'page': next_cursor})
+        self.assertContains(response, 'Пост 0')
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user(username='search', email='search@test.com', password='password123')
+        phones = Category.objects.create(name='Телефоны')
+        tablets = Category.objects.create(name='Планшеты')
+        self.phone = Product.objects.create(
+            name='Смартфон Альфа', description='Камера и батарея', price=100, category=phones, owner=owner
+        )
+        self.tablet = Product.objects.create(
+            name='Планшет Бета', description='Большой экран', price=200, category=tablets, owner=owner
+        )
+
+    def test_search_matches_name_description_and_category(self):
+        self.assertEqual(list(search_products('смартф')), [self.phone])
+        self.assertEqual(list(search_products('экран')), [self.tablet])
+        self.assertEqual(list(search_products('телефоны')), [self.phone])
+        self.assertEqual(list(search_products('смартфон экран')), [])
+        self.assertEqual(list(search_products('  ')), [])
+
+    def test_homepage_search(self):
+        response = self.client.get(reverse('catalog:homepage'), {'q': 'планшет'})
+        self.assertContains(response, 'Планшет Бета')
+        self.assertNotContains(response, 'Смартфон Альфа')
+        self.assertContains(response, 'value="планшет"')
+
+    @skipUnless(connection.vendor == 'postgresql', 'Полнотекстовый поиск требует PostgreSQL')
+    def test_search_vector_follows_category_rename(self):
+        self.phone.category.name = 'Гаджеты'
+        self.phone.category.save()
+        self.assertEqual(list(search_products('гаджет')), [self.phone])
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        autocomplete._index = None
+        self.owner = User.objects.create_user(username='ac', email='ac@test.com', password='password123')
+        self.category = Category.objects.create(name='Категория')
+        self.phone = self.create_product('Смартфон Альфа')
+        self.create_product('Планшет Бета')
+        self.create_product('Черновик', is_published=False)
+
+    def create_product(self, name, is_published=True):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(
+                name=name, price=1, category=self.category, owner=self.owner, is_published=is_published
+            )
+
+    def test_index_tolerates_typos(self):
+        index = autocomplete.TrigramIndex()
+        index.add(1, 'Смартфон Альфа')
+        index.add(2, 'Планшет Бета')
+        self.assertEqual(index.search('смартофн')[0][0], 1)
+        index.remove(1)
+        self.assertNotIn(1, [pk for pk, _, _ in index.search('смартфон')])
+        self.assertEqual(index.search(''), [])
+
+    def test_endpoint_returns_published_matches(self):
+        response = self.client.get(reverse('catalog:product_autocomplete'), {'q': 'смартфн'})
+        results = response.json()['results']
+        self.assertEqual(results[0]['id'], self.phone.pk)
+        self.assertNotIn('Черновик', [r['name'] for r in response.json()['results']])
+        response = self.client.get(reverse('catalog:product_autocomplete'), {'q': 'черновик'})
+        self.assertNotIn('Черновик', [r['name'] for r in response.json()['results']])
+
+    def test_negative_limit_is_clamped(self):
+        response = self.client.get(reverse('catalog:product_autocomplete'), {'q': 'смартфн', 'limit': -1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_index_follows_writes_incrementally(self):
+        previous = autocomplete.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.phone.name = 'Ноутбук Гамма'
+            self.phone.save()
+        self.create_product('Наушники Дельта')
+        with self.assertNumQueries(0):
+            index = autocomplete.get_index()
+        self.assertIn('Ноутбук Гамма', index.names.values())
+        self.assertIn('Наушники Дельта', index.names.values())
+        self.assertNotIn('Смартфон Альфа', index.names.values())
+        # Читатели старой версии индекса не видят изменений посреди поиска
+        self.assertIsNot(index, previous)
+        self.assertIn('Смартфон Альфа', previous.names.values())
+        # Копируются только массивы затронутых триграмм, остальные общие
+        others = 'Смартфон Альфа Ноутбук Гамма Наушники Дельта'
+        untouched = autocomplete.trigrams('Планшет Бета') - autocomplete.trigrams(others)
+        self.assertTrue(untouched)
+        self.assertTrue(all(index.postings[gram] is previous.postings[gram] for gram in untouched))
+        self.assertTrue(all(self.phone.pk in previous.postings[gram] for gram in autocomplete.trigrams('Смартфон')))
+
+    def test_new_worker_warms_from_snapshot(self):
+        autocomplete.get_index()
+        autocomplete._index = None
+        with self.assertNumQueries(0):
+            index = autocomplete.get_index()
+        self.assertEqual(len(index.names), 2)
+
+
+class CatalogImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(
+            username='importer', email='importer@test.com', password='password123', is_superuser=True
+        )
+        Category.objects.create(name='Телефоны')
+
+    def write_file(self, suffix, content):
+        handle = tempfile.NamedTemporaryFile('w', suffix=suffix, encoding='utf-8', delete=False)
+        with handle:
+            handle.write(content)
+        self.addCleanup(os.remove, handle.name)
+        return handle.name
+
+    def test_streaming_json_array_parser(self):
+        stream = StringIO('[ {"a": 1},\n {"b": "]"} ,{"c": [1, 2]}]')
+        self.assertEqual(list(iter_json_array(stream)), [{'a': 1}, {'b': ']'}, {'c': [1, 2]}])
+
+    def test_jsonl_import_in_batches(self):
+        rows = [
+            {'name': f'Товар {i}', 'price': '10.50', 'category': 'Телефоны' if i % 2 else 'Планшеты'}
+            for i in range(7)
+        ]
+        rows.append({'name': '', 'price': '1', 'category': 'Телефоны'})
+        path = self.write_file('.jsonl', '\n'.join(json.dumps(row, ensure_ascii=False) for row in rows))
+        importer = CatalogImporter(self.owner, batch_size=3)
+        # По три запроса на пакет (savepoint, INSERT, release) и один INSERT новой категории
+        with self.assertNumQueries(10):
+            importer.import_file(path)
+        self.assertEqual((importer.created, importer.skipped), (7, 1))
+        self.assertEqual(Category.objects.filter(name='Планшеты').count(), 1)
+        self.assertEqual(Product.objects.filter(category__name='Телефоны', owner=self.owner).count(), 3)
+
+    def test_csv_upsert_by_natural_key(self):
+        path = self.write_file('.csv', 'name,price,category,is_published\nСмартфон,100,Телефоны,true\n')
+        CatalogImporter(self.owner).import_file(path)
+        path = self.write_file('.csv', 'name,price,category\nСмартфон,150,Телефоны\nПланшет,90,Телефоны\n')
+        importer = CatalogImporter(self.owner, upsert=True).import_file(path)
+        self.assertEqual((importer.created, importer.updated), (1, 1))
+        self.assertEqual(Product.objects.get(name='Смартфон').price, 150)
+
+    def test_upsert_refreshes_cached_product_pages(self):
+        path = self.write_file('.csv', 'name,price,category,is_published\nСмартфон,100.00,Телефоны,true\n')
+        CatalogImporter(self.owner).import_file(path)
+        product = Product.objects.get(name='Смартфон')
+        detail_url = reverse('catalog:product_detail', args=[product.pk])
+        self.assertContains(self.client.get(reverse('catalog:homepage')), '100')
+        self.assertContains(self.client.get(detail_url), '100')
+        path = self.write_file('.csv', 'name,price,category,is_published\nСмартфон,777.00,Телефоны,true\n')
+        CatalogImporter(self.owner, upsert=True).import_file(path)
+        self.assertContains(self.client.get(reverse('catalog:homepage')), '777')
+        self.assertContains(self.client.get(detail_url), '777')
+
+    def test_import_invalidates_listing_cache(self):
+        self.client.get(reverse('catalog:homepage'))
+        path = self.write_file('.jsonl', json.dumps({'name': 'Импортированный', 'price': 1, 'category': 'Телефоны'}))
+        call_command('import_catalog', path, stdout=StringIO())
+        self.assertContains(self.client.get(reverse('catalog:homepage')), 'Импортированный')
+
+    def test_populate_db_uses_fixture(self):
+        call_command('populate_db', stdout=StringIO())
+        self.assertEqual(Product.objects.filter(owner=self.owner).count(), 2)
+        self.assertEqual(Category.objects.get().description, 'Гаджеты и устройства')
+
+
+class CatalogExportTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(
+            username='staff', email='staff@test.com', password='password123', is_staff=True
+        )
+        category = Category.objects.create(name='Телефоны')
+        self.products = [
+            Product.objects.create(name=f'Товар {i}', price=i, category=category, owner=self.staff)
+            for i in range(3)
+        ]
+        Version.objects.create(product=self.products[0], version_number='2', version_name='Текущая', is_current=True)
+
+    def test_export_requires_staff(self):
+        User.objects.create_user(username='user', email='user@test.com', password='password123')
+        self.client.login(email='user@test.com', password='password123')
+        self.assertEqual(self.client.get(reverse('catalog:catalog_export')).status_code, 403)
+
+    def test_csv_export_streams_rows_with_category_and_version(self):
+        self.client.login(email='staff@test.com', password='password123')
+        response = self.client.get(reverse('catalog:catalog_export'))
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual((rows[0]['category'], rows[0]['version_name']), ('Телефоны', 'Текущая'))
+        self.assertEqual(rows[1]['version_name'], '')
+
+    def test_gzip_jsonl_export(self):
+        self.client.login(email='staff@test.com', password='password123')
+        response = self.client.get(reverse('catalog:catalog_export'), {'format': 'jsonl', 'gzip': '1'})
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual([json.loads(line)['name'] for line in lines], ['Товар 0', 'Товар 1', 'Товар 2'])
+
+    def test_export_command_round_trips_through_importer(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'catalog.jsonl')
+            with self.assertNumQueries(1):
+                call_command('export_catalog', format='jsonl', output=path, chunk_size=2)
+            Product.objects.all().delete()
+            CatalogImporter(self.staff).import_file(path)
+        self.assertEqual(Product.objects.count(), 3)
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root, IMAGE_PROCESSING_SYNC=True)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.media_root = media_root
+        self.owner = User.objects.create_user(username='img', email='img@test.com', password='password123')
+        self.category = Category.objects.create(name='Категория')
+
+    def upload(self, width=1200, height=800):
+        buffer = BytesIO()
+        Image.new('RGB', (width, height), 'red').save(buffer, format='PNG')
+        return SimpleUploadedFile('photo.png', buffer.getvalue(), content_type='image/png')
+
+    def test_upload_generates_hashed_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                name='С картинкой', price=1, category=self.category, owner=self.owner, image=self.upload()
+            )
+        manifest = images.get_derivatives(product.image.name)
+        self.assertEqual([width for width, _ in manifest['variants']['webp']], [320, 640, 1024])
+        for width, path in manifest['variants']['webp']:
+            self.assertTrue(os.path.exists(os.path.join(self.media_root, path)))
+            self.assertIn(manifest['hash'], path)
+            with Image.open(os.path.join(self.media_root, path)) as variant:
+                self.assertEqual(variant.width, width)
+
+        response = self.client.get(reverse('catalog:homepage'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, f'{manifest["hash"]}-640.webp 640w')
+
+    def test_small_images_are_not_upscaled(self):
+        manifest = images.process_image(self.media_root, self._save_original(200, 100))
+        self.assertEqual([width for width, _ in manifest['variants']['jpeg']], [200])
+
+    def test_process_pool_path(self):
+        name = self._save_original(400, 300)
+        with override_settings(IMAGE_PROCESSING_SYNC=False):
+            manifest = images.schedule_derivatives(name).result(timeout=30)
+        self.assertEqual([width for width, _ in manifest['variants']['webp']], [320, 400])
+
+    def _save_original(self, width, height):
+        name = f'products/original-{width}.png'
+        os.makedirs(os.path.join(self.media_root, 'products'), exist_ok=True)
+        Image.new('RGB', (width, height), 'blue').save(os.path.join(self.media_root, name))
+        return name
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root, MEDIA_ACCEL_REDIRECT_PREFIX='')
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(os.path.join(media_root, 'products'))
+        self.payload = bytes(range(256)) * 16
+        with open(os.path.join(media_root, 'products', 'file.bin'), 'wb') as f:
+            f.write(self.payload)
+
+    def test_fingerprinted_url_is_immutable(self):
+        url = media_tags.mymedia('products/file.bin')
+        fingerprint = media.media_fingerprint('products/file.bin')
+        self.assertEqual(url, f'/media/products/file.bin?v={fingerprint}')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.payload)
+        self.assertEqual(response['ETag'], f'"{fingerprint}"')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        plain = self.client.get('/media/products/file.bin')
+        self.assertNotIn('immutable', plain['Cache-Control'])
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get('/media/products/file.bin')['ETag']
+        response = self.client.get('/media/products/file.bin', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_range_requests(self):
+        response = self.client.get('/media/products/file.bin', HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.payload)}')
+        self.assertEqual(b''.join(response.streaming_content), self.payload[100:200])
+
+        suffix = self.client.get('/media/products/file.bin', HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(suffix.streaming_content), self.payload[-10:])
+
+        stale = self.client.get('/media/products/file.bin', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(stale.status_code, 200)
+
+        unsatisfiable = self.client.get('/media/products/file.bin', HTTP_RANGE=f'bytes={len(self.payload)}-')
+        self.assertEqual(unsatisfiable.status_code, 416)
+
+    def test_fingerprint_follows_content(self):
+        before = media.media_fingerprint('products/file.bin')
+        path = os.path.join(settings.MEDIA_ROOT, 'products', 'file.bin')
+        with open(path, 'wb') as f:
+            f.write(b'changed')
+        self.assertNotEqual(media.media_fingerprint('products/file.bin'), before)
+
+    def test_accel_redirect_and_traversal(self):
+        with override_settings(MEDIA_ACCEL_REDIRECT_PREFIX='/protected-media/'):
+            response = self.client.get('/media/products/file.bin')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/products/file.bin')
+        self.assertEqual(response.content, b'')
+
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/products/missing.bin').status_code, 404)
+
+
+class ObjectPermissionMixinTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            username='perm_owner', email='perm_owner@test.com', password='password123'
+        )
+        self.other = User.objects.create_user(
+            username='perm_other', email='perm_other@test.com', password='password123'
+        )
+        self.product = Product.objects.create(
+            name='Продукт', price=10, category=Category.objects.create(name='Категория'), owner=self.owner
+        )
+        self.version = Version.objects.create(product=self.product, version_number='1', version_name='Первая')
+        self.blog_post = BlogPost.objects.create(title='Пост', content='Текст')
+
+    def product_selects(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, data or {})
+        selects = [q['sql'] for q in context.captured_queries
+                   if q['sql'].startswith('SELECT') and 'FROM "catalog_product"' in q['sql']]
+        return response, selects
+
+    def test_update_fetches_product_once(self):
+        self.client.login(email='perm_owner@test.com', password='password123')
+        response, selects = self.product_selects('get', reverse('catalog:update_product', args=[self.product.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(selects), 1)
+        self.assertIn('"users_customuser"', selects[0])
+        self.assertIn('"catalog_category"', selects[0])
+
+    def test_delete_fetches_product_once(self):
+        self.client.login(email='perm_owner@test.com', password='password123')
+        response, selects = self.product_selects('post', reverse('catalog:delete_product', args=[self.product.pk]))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(selects), 1)
+        self.assertFalse(Product.objects.filter(pk=self.product.pk).exists())
+
+    def test_version_views_follow_product_owner(self):
+        url = reverse('catalog:update_version', args=[self.version.pk])
+        self.client.login(email='perm_other@test.com', password='password123')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.login(email='perm_owner@test.com', password='password123')
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        version_selects = [q for q in context.captured_queries if 'FROM "catalog_version"' in q['sql']]
+        self.assertEqual(len(version_selects), 1)
+
+    def test_blog_views_require_permission(self):
+        url = reverse('catalog:blogpost_update', args=[self.blog_post.pk])
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.other.user_permissions.add(Permission.objects.get(codename='change_blogpost'))
+        self.client.login(email='perm_other@test.com', password='password123')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.post(reverse('catalog:blogpost_delete', args=[self.blog_post.pk]))
+        self.assertEqual(response.status_code, 403)
+
+
+class CatalogIndexTests(TestCase):
+    def test_single_current_version_per_product(self):
+        owner = User.objects.create_user(username='idx', email='idx@test.com', password='password123')
+        category = Category.objects.create(name='К')
+        product = Product.objects.create(name='Продукт', price=1, category=category, owner=owner)
+        Version.objects.create(product=product, version_number='1', version_name='Первая', is_current=True)
+        Version.objects.create(product=product, version_number='2', version_name='Черновик')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Version.objects.create(product=product, version_number='3', version_name='Вторая', is_current=True)
+
+    def test_explain_reports_index_usage(self):
+        out = StringIO()
+        call_command('explain_catalog_queries', stdout=out)
+        for index_name in ('catalog_product_created_idx', 'catalog_product_published_idx',
+                           'catalog_version_one_current', 'catalog_blogpost_published_idx'):
+            self.assertIn(f'Используется индекс {index_name}', out.getvalue())
+
+
+class CatalogBenchmarkTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        benchmarks.seed_catalog(products=30, categories=3, versions=2, blog_posts=5, seed=1)
+
+    def test_seed_is_deterministic(self):
+        self.assertEqual(Product.objects.count(), 30)
+        self.assertEqual(Version.objects.filter(is_current=True).count(), 30)
+        names = list(Product.objects.order_by('pk').values_list('name', flat=True)[:5])
+        Product.objects.all().delete()
+        benchmarks.seed_catalog(products=30, categories=3, versions=2, blog_posts=0, seed=1)
+        self.assertEqual(list(Product.objects.order_by('pk').values_list('name', flat=True)[:5]), names)
+
+    def test_warm_endpoints_stay_within_query_budget(self):
+        results = benchmarks.run_benchmarks(requests=5, warmup=1)
+        self.assertEqual(set(results), {
+            'homepage', 'product_list', 'product_detail', 'blogpost_list', 'blogpost_detail', 'category_list', 'search'
+        })
+        for result in results.values():
+            self.assertLessEqual(result['latency_ms']['p50'], result['latency_ms']['p99'])
+            self.assertGreater(result['bytes']['mean'], 0)
+        for name in ('homepage', 'product_list', 'product_detail', 'category_list'):
+            self.assertEqual(results[name]['queries']['max'], 0, name)
+        self.assertLessEqual(results['blogpost_list']['queries']['max'], 2)
+
+    def test_benchmark_command_writes_json(self):
+        output = os.path.join(tempfile.mkdtemp(), 'bench.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(output))
+        with mock.patch('catalog.management.commands.benchmark_catalog.setup_databases'), \
+                mock.patch('catalog.management.commands.benchmark_catalog.teardown_databases'), \
+                mock.patch('catalog.management.commands.benchmark_catalog.setup_test_environment'), \
+                mock.patch('catalog.management.commands.benchmark_catalog.teardown_test_environment'):
+            call_command('benchmark_catalog', products=10, blog_posts=2, requests=2, warmup=0, output=output)
+        with open(output, encoding='utf-8') as f:
+            report = json.load(f)
+        self.assertEqual(report['dataset']['products'], 10)
+        self.assertIn('p99', report['endpoints']['homepage']['latency_ms'])
+
+
+class RequestInstrumentationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        instrumentation.aggregator.reset()
+        self.blog_post = BlogPost.objects.create(title='Пост', content='Текст', is_published=True)
+
+    def test_server_timing_and_view_stats(self):
+        response = self.client.get(reverse('catalog:blogpost_list'))
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries".*tpl;dur=[\d.]+.*total;dur=')
+
+        instrumentation.aggregator.flush()
+        stats = instrumentation.load_view_stats()['catalog:blogpost_list']
+        self.assertEqual(stats['count'], 1)
+        self.assertGreaterEqual(stats['queries'], 1)
+        self.assertGreater(stats['template_ms'], 0)
+
+        out = StringIO()
+        call_command('request_stats', stdout=out)
+        self.assertIn('catalog:blogpost_list', out.getvalue())
+        call_command('request_stats', reset=True, stdout=StringIO())
+        self.assertEqual(instrumentation.load_view_stats(), {})
+
+    def test_flush_runs_outside_the_request(self):
+        instrumentation.aggregator.last_flush = 0
+        with mock.patch.object(instrumentation.MetricsAggregator, 'flush') as flush, \
+                mock.patch.object(instrumentation.threading, 'Thread') as thread:
+            self.client.get(reverse('catalog:blogpost_list'))
+        flush.assert_not_called()
+        thread.assert_called_once()
+        thread.return_value.start.assert_called_once()
+        self.assertTrue(instrumentation.aggregator.flushing)
+        instrumentation.aggregator.flushing = False
+
+    def test_redis_flush_is_one_pipeline(self):
+        backend = RedisCache('redis://localhost:6379/0', {'OPTIONS': {}})
+        redis_client = mock.Mock()
+        with mock.patch.object(instrumentation, 'caches', {'default': backend}), \
+                mock.patch.object(backend.client, 'get_client', return_value=redis_client):
+            instrumentation.increment_many({'request_metrics:a:count': 2, 'request_metrics:a:db_ms': 1500})
+        redis_client.pipeline.assert_called_once_with(transaction=False)
+        pipeline = redis_client.pipeline.return_value
+        self.assertEqual(pipeline.incrby.call_count, 2)
+        pipeline.execute.assert_called_once()
+
+    @override_settings(REQUEST_QUERY_BUDGET=0)
+    def test_budget_breach_is_logged(self):
+        with self.assertLogs('myshop.performance', 'WARNING') as logs:
+            self.client.get(reverse('catalog:blogpost_list'))
+        self.assertTrue(any('catalog:blogpost_list' in line for line in logs.output))
+        instrumentation.aggregator.flush()
+        self.assertEqual(instrumentation.load_view_stats()['catalog:blogpost_list']['over_budget'], 1)
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_slow_queries_are_logged(self):
+        with self.assertLogs('myshop.performance', 'WARNING') as logs:
+            self.client.get(reverse('catalog:blogpost_detail', args=[self.blog_post.pk]))
+        self.assertTrue(any('Медленный запрос' in line and 'catalog_blogpost' in line for line in logs.output))
+
+    def test_redis_client_counts_hits_and_misses(self):
+        client = instrumentation.InstrumentedRedisClient('redis://localhost:6379/0', {}, mock.Mock())
+        metrics = instrumentation.RequestMetrics()
+        token = instrumentation._current.set(metrics)
+        try:
+            with mock.patch.object(DefaultClient, 'get', side_effect=lambda key, default=None, **kwargs: default):
+                self.assertEqual(client.get('missing', default='fallback'), 'fallback')
+            with mock.patch.object(DefaultClient, 'get', return_value=None):
+                self.assertIsNone(client.get('stored_none'))
+            with mock.patch.object(DefaultClient, 'get_many', return_value={'a': 1}):
+                client.get_many(['a', 'b', 'c'])
+        finally:
+            instrumentation._current.reset(token)
+        self.assertEqual((metrics.cache_hits, metrics.cache_misses), (2, 3))
+
+
+@override_settings(METRICS_TOKEN='secret')
+class MetricsEndpointTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def scrape(self):
+        return self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+
+    def sample(self, body, name, **labels):
+        for family in text_string_to_metric_families(body):
+            for sample in family.samples:
+                if sample.name == name and all(sample.labels.get(k) == v for k, v in labels.items()):
+                    return sample.value
+        return 0
+
+    def test_request_and_cache_metrics_are_exported(self):
+        before = self.sample(self.scrape().content.decode(),
+                             'myshop_http_request_duration_seconds_count', view='catalog:homepage')
+        self.client.get(reverse('catalog:homepage'))
+        self.client.get(reverse('catalog:homepage'))
+        response = self.scrape()
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertEqual(self.sample(body, 'myshop_http_request_duration_seconds_count',
+                                     view='catalog:homepage', method='GET', status='2xx'), before + 2)
+        self.assertGreater(self.sample(body, 'myshop_cache_lookups_total', family='products_page', result='hit'), 0)
+        self.assertGreater(self.sample(body, 'myshop_db_queries_per_request_count', view='other'), 0)
+
+    def test_token_protects_endpoint(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.scrape().status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_endpoint_is_hidden_without_token_in_production(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_multiprocess_directory_is_aggregated(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        script = (
+            'import django; django.setup()\n'
+            'from myshop.metrics import EMAIL_SEND_DURATION\n'
+            'EMAIL_SEND_DURATION.labels("sent").observe(0.2)\n'
+        )
+        env = {**os.environ, 'PROMETHEUS_MULTIPROC_DIR': directory, 'PYTHONPATH': os.pathsep.join(sys.path)}
+        for _ in range(2):
+            subprocess.run([sys.executable, '-c', script], env=env, check=True, cwd=settings.BASE_DIR)
+        with override_settings(PROMETHEUS_MULTIPROC_DIR=directory):
+            body = self.scrape().content.decode()
+        self.assertEqual(self.sample(body, 'myshop_email_send_duration_seconds_count', outcome='sent'), 2)
+
+
+class FakePool:
+    def __init__(self, stats):
+        self.stats = stats
+
+    def pop_stats(self):
+        stats, self.stats = self.stats, {key: 0 for key in self.stats}
+        return stats
+
+
+class DatabaseConnectionTests(TestCase):
+    def test_pool_requires_django_51_and_psycopg_pool(self):
+        with mock.patch.object(db.django, 'VERSION', (5, 0, 6, 'final', 0)):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'Django 5.1'):
+                db.pool_options(2, 10, 10, 1800)
+        with mock.patch.object(db.django, 'VERSION', (5, 1, 0, 'final', 0)):
+            with mock.patch.dict(sys.modules, {'psycopg_pool': None}):
+                with self.assertRaisesMessage(ImproperlyConfigured, 'psycopg'):
+                    db.pool_options(2, 10, 10, 1800)
+            with mock.patch.dict(sys.modules, {'psycopg_pool': mock.Mock()}):
+                self.assertEqual(db.pool_options(2, 10, 5, 600),
+                                 {'min_size': 2, 'max_size': 10, 'timeout': 5, 'max_lifetime': 600})
+                with self.assertRaises(ImproperlyConfigured):
+                    db.pool_options(5, 2, 5, 600)
+
+    def test_async_views_disable_persistent_connections(self):
+        self.assertEqual(db.connection_max_age(60, asgi=False), 60)
+        self.assertEqual(db.connection_max_age(60, asgi=True), 0)
+
+    def test_persistent_connection_is_reused_between_requests(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        database = {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(directory, 'db.sqlite3'),
+            'CONN_MAX_AGE': 60, 'CONN_HEALTH_CHECKS': True,
+        }
+        handler = ConnectionHandler({'default': {**database, 'CONN_MAX_AGE': 0}, 'persistent': database})
+        self.addCleanup(handler.close_all)
+        opened = REGISTRY.get_sample_value('myshop_db_connections_opened_total', {'alias': 'persistent'}) or 0
+        persistent = handler['persistent']
+        for _ in range(3):
+            # Так Django обрабатывает соединения на границах запроса (close_old_connections)
+            persistent.close_if_unusable_or_obsolete()
+            persistent.cursor().execute('SELECT 1')
+            persistent.close_if_unusable_or_obsolete()
+        self.assertEqual(REGISTRY.get_sample_value('myshop_db_connections_opened_total', {'alias': 'persistent'}),
+                         opened + 1)
+        self.assertIsNotNone(persistent.connection)
+
+        per_request = handler['default']
+        per_request.cursor().execute('SELECT 1')
+        per_request.close_if_unusable_or_obsolete()
+        self.assertIsNone(per_request.connection)
+
+    def test_pool_saturation_is_exported(self):
+        default = connections['default']
+        pool = FakePool({
+            'pool_max': 10, 'pool_size': 10, 'pool_available': 1, 'requests_waiting': 3,
+            'requests_wait_ms': 1500, 'requests_errors': 2,
+        })
+        settings_dict = {**default.settings_dict, 'OPTIONS': {'pool': {'max_size': 10}}}
+        with mock.patch.object(default, 'settings_dict', settings_dict), \
+                mock.patch.object(default, 'pool', pool, create=True):
+            waited = REGISTRY.get_sample_value('myshop_db_pool_wait_seconds_total', {'alias': 'default'}) or 0
+            # Middleware снимает статистику пула в конце каждого запроса
+            self.client.get(reverse('catalog:category_list'))
+        sample = REGISTRY.get_sample_value
+        self.assertEqual(sample('myshop_db_pool_connections', {'alias': 'default', 'state': 'in_use'}), 9)
+        self.assertEqual(sample('myshop_db_pool_connections', {'alias': 'default', 'state': 'max'}), 10)
+        self.assertEqual(sample('myshop_db_pool_waiting_requests', {'alias': 'default'}), 3)
+        self.assertEqual(sample('myshop_db_pool_wait_seconds_total', {'alias': 'default'}), waited + 1.5)
+        self.assertGreaterEqual(sample('myshop_db_pool_timeouts_total', {'alias': 'default'}), 2)
+        self.assertIn(b'myshop_db_pool_connections', metrics.collect_metrics())
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        # Вторая SQLite-база играет роль реплики; схема создаётся до того, как router запретит миграции на ней
+        replica = ConnectionHandler({
+            'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(directory, 'replica.sqlite3')},
+        }).settings['default']
+        patcher = mock.patch.dict(connections.settings, {'replica': replica})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(connections.__delitem__, 'replica')
+        self.addCleanup(lambda: connections['replica'].close())
+        call_command('migrate', database='replica', verbosity=0)
+
+        override = override_settings(DATABASE_REPLICAS=['replica'], REPLICA_LAG_CHECK_INTERVAL=0)
+        override.enable()
+        self.addCleanup(override.disable)
+        replicas.reset_lag_checks()
+        cache.clear()
+        Category.objects.using('replica').create(name='Категория с реплики')
+        Category.objects.create(name='Категория основной базы')
+
+    def category_names(self):
+        return list(Category.objects.values_list('name', flat=True))
+
+    def test_catalog_reads_go_to_replica_and_writes_to_primary(self):
+        self.assertEqual(self.category_names(), ['Категория с реплики'])
+        category = Category.objects.get()
+        self.assertEqual(category._state.db, 'replica')
+        category.name = 'Переименована'
+        category.save()
+        self.assertEqual(Category.objects.using('default').get(pk=category.pk).name, 'Переименована')
+        self.assertEqual(Category.objects.using('replica').get(pk=category.pk).name, 'Категория с реплики')
+
+        User.objects.create_user(username='primary_only', email='primary@test.com', password='password123')
+        self.assertEqual(User.objects.count(), 1)
+        with transaction.atomic():
+            self.assertEqual(self.category_names(), ['Переименована'])
+        self.assertFalse(router.allow_migrate('replica', 'catalog'))
+
+    def test_lagging_or_unreachable_replica_falls_back_to_primary(self):
+        with mock.patch.object(replicas, 'replica_lag', return_value=60.0):
+            with self.assertLogs('myshop.performance', 'WARNING'):
+                self.assertEqual(self.category_names(), ['Категория основной базы'])
+        with mock.patch.object(replicas, 'replica_lag', return_value=None):
+            self.assertEqual(self.category_names(), ['Категория основной базы'])
+        replicas.reset_lag_checks()
+        with override_settings(REPLICA_LAG_CHECK_INTERVAL=60), \
+                mock.patch.object(replicas, 'replica_lag', return_value=0.0) as lag:
+            self.category_names()
+            self.category_names()
+        self.assertEqual(lag.call_count, 1)
+
+    def test_user_is_pinned_to_primary_after_write(self):
+        factory = RequestFactory()
+
+        def write(request):
+            Category.objects.create(name='Новая категория')
+            return HttpResponse()
+
+        def read(request):
+            return HttpResponse(', '.join(self.category_names()))
+
+        response = replicas.ReplicaPinningMiddleware(write)(factory.post('/'))
+        cookie = response.cookies[replicas.PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+
+        reader = replicas.ReplicaPinningMiddleware(read)
+        self.assertEqual(reader(factory.get('/')).content.decode(), 'Категория с реплики')
+        request = factory.get('/')
+        request.COOKIES[replicas.PIN_COOKIE] = cookie.value
+        self.assertIn('Новая категория', reader(request).content.decode())
+        self.assertNotIn(replicas.PIN_COOKIE, reader(factory.get('/')).cookies)
+
+    def test_cache_fills_read_from_primary(self):
+        # Отстающая реплика не должна попасть в кэш под новым поколением
+        self.assertEqual(self.category_names(), ['Категория с реплики'])
+        self.assertEqual([category.name for category in get_categories()], ['Категория основной базы'])
+        response = self.client.get(reverse('catalog:category_list'))
+        self.assertContains(response, 'Категория основной базы')
+        self.assertNotContains(response, 'Категория с реплики')
+        with replicas.read_from_primary():
+            self.assertEqual(self.category_names(), ['Категория основной базы'])
+        self.assertEqual(self.category_names(), ['Категория с реплики'])
+
+    def test_page_cache_miss_renders_from_primary(self):
+        class CategoryNamesView(AnonymousPageCacheMixin, View):
+            def get(view, request):
+                return HttpResponse(', '.join(self.category_names()))
+
+        factory = RequestFactory()
+
+        def get(path, **cookies):
+            request = factory.get(path)
+            request.user = AnonymousUser()
+            request.COOKIES.update(cookies)
+            return replicas.ReplicaPinningMiddleware(CategoryNamesView.as_view())(request)
+
+        # Ответ, который попадёт в кэш страниц, собирается с основной базы; некэшируемый — с реплики
+        self.assertEqual(get('/cached/').content.decode(), 'Категория основной базы')
+        self.assertEqual(get('/uncached/', messages='1').content.decode(), 'Категория с реплики')
+
+    def test_fragment_views_render_from_primary(self):
+        # На реплике ещё старые строки, а поколение уже сдвинуто записью в основную базу
+        for alias, suffix in (('replica', 'старый'), ('default', 'новый')):
+            owner = User.objects.db_manager(alias).create_user(username='owner', password='password123')
+            category = Category.objects.using(alias).get()
+            Product.objects.using(alias).create(
+                pk=1, name=f'Товар {suffix}', price=100, category=category, owner=owner, is_published=True,
+            )
+            BlogPost.objects.using(alias).create(pk=1, title=f'Статья {suffix}', slug='post', content='Текст')
+
+        pages = [
+            (reverse('catalog:homepage'), {'q': 'товар'}),
+            (reverse('catalog:blogpost_detail', args=[1]), {}),
+        ]
+        with override_settings(CATALOG_PAGINATION='keyset'):
+            pages.append((reverse('catalog:homepage'), {}))
+            for path, params in pages:
+                response = self.client.get(path, params)
+                self.assertNotContains(response, 'старый')
+                self.assertContains(response, 'новый')
+
+
+def reload_urls():
+    importlib.reload(catalog_urls)
+    importlib.reload(myshop_urls)
+    clear_url_caches()
+
+
+class FakeAsyncRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    async def set(self, key, value, px=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def delete(self, key):
+        return int(self.data.pop(key, None) is not None)
+
+
+class AsyncCatalogViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with override_settings(CATALOG_ASYNC_VIEWS=True):
+            reload_urls()
+
+    @classmethod
+    def tearDownClass(cls):
+        reload_urls()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='async_owner', email='async@test.com', password='password123')
+        self.category = Category.objects.create(name='Асинхронная категория')
+        for i in range(12):
+            product = Product.objects.create(
+                name=f'Async продукт {i}', price=100 + i, category=self.category, owner=self.owner, is_published=True
+            )
+            Version.objects.create(product=product, version_number='1', version_name=f'Версия {i}', is_current=True)
+        self.product = Product.objects.order_by('pk').first()
+        for i in range(3):
+            BlogPost.objects.create(title=f'Async пост {i}', content='Текст', is_published=True)
+
+    def test_async_views_are_routed(self):
+        self.assertIs(myshop_urls.urlpatterns[2].url_patterns[1].callback.view_class, async_views.AsyncHomepageView)
+
+    async def test_homepage_matches_sync_view(self):
+        response = await self.async_client.get(reverse('catalog:homepage'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Async продукт 11')
+        self.assertContains(response, 'Версия 11')
+
+        second = await self.async_client.get(reverse('catalog:product_list'), {'page': 2})
+        self.assertContains(second, 'Async продукт 0')
+        self.assertNotContains(second, 'Async продукт 11')
+
+    async def test_invalid_page_is_404(self):
+        for name in ('catalog:homepage', 'catalog:product_list', 'catalog:blogpost_list'):
+            for page in (99, 'x', 0, -3):
+                response = await self.async_client.get(reverse(name), {'page': page})
+                self.assertEqual(response.status_code, 404, (name, page))
+        # Пустой список id для несуществующей страницы не остаётся в кэше
+        self.assertIsNone(cache.get(versioned_key('products_page:10:99', 'products')))
+
+    async def test_search_falls_back_to_sync_view(self):
+        response = await self.async_client.get(reverse('catalog:homepage'), {'q': 'продукт 3'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Async продукт 3')
+        self.assertNotContains(response, 'Async продукт 4')
+
+    def test_product_detail_is_cached_for_anonymous(self):
+        get = async_to_sync(self.async_client.get)
+        url = reverse('catalog:product_detail', args=[self.product.pk])
+        first = get(url)
+        self.assertContains(first, 'Async продукт 0')
+        with self.assertNumQueries(0):
+            second = get(url)
+        self.assertEqual(first.content, second.content)
+
+        missing = get(reverse('catalog:product_detail', args=[10 ** 6]))
+        self.assertEqual(missing.status_code, 404)
+
+    async def test_category_and_blog_lists(self):
+        response = await self.async_client.get(reverse('catalog:category_list'))
+        self.assertContains(response, 'Асинхронная категория')
+        response = await self.async_client.get(reverse('catalog:blogpost_list'))
+        self.assertContains(response, 'Async пост 2')
+
+    def test_redis_adapter_shares_encoding_with_django_redis(self):
+        backend = RedisCache('redis://localhost:6379/0', {'OPTIONS': {}})
+        adapter = RedisAsyncCache(backend)
+        fake = FakeAsyncRedis()
+
+        async def scenario():
+            adapter.clients[asyncio.get_running_loop()] = fake
+            await adapter.set('page', {'html': 'ok'}, 60)
+            await adapter.set('counter', 5, 60)
+            self.assertFalse(await adapter.add('counter', 6, 60))
+            return await adapter.get('page'), await adapter.get_many(['counter', 'missing'])
+
+        page, many = asyncio.run(scenario())
+        self.assertEqual(page, {'html': 'ok'})
+        self.assertEqual(many, {'counter': 5})
+        self.assertEqual(backend.client.decode(fake.data[backend.make_key('page')]), {'html': 'ok'})
+        self.assertEqual(fake.data[backend.make_key('counter')], 5)
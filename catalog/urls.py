@@ -1,4 +1,3 @@
-from django.views.decorators.cache import cache_page
 from django.urls import path
 from .views import ProductListView
 from .views import (
@@ -6,16 +5,27 @@ from .views import (
     ProductDeleteView, UnpublishProductView, ContactView,
     BlogPostListView, BlogPostDetailView, BlogPostCreateView,
     BlogPostUpdateView, BlogPostDeleteView, VersionCreateView,
-    VersionUpdateView, VersionDeleteView, CategoryListView
+    VersionUpdateView, VersionDeleteView, CategoryListView, ProductAutocompleteView,
+    CatalogExportView
 )
+from django.conf import settings
+
+if settings.CATALOG_ASYNC_VIEWS:
+    # Под ASGI страницы чтения обслуживают нативные async-представления
+    from .async_views import (  # noqa: F811
+        AsyncBlogPostListView as BlogPostListView, AsyncCategoryListView as CategoryListView,
+        AsyncHomepageView as HomepageView, AsyncProductDetailView as ProductDetailView,
+        AsyncProductListView as ProductListView,
+    )
 
 app_name = 'catalog'
 
 urlpatterns = [
-    path('product/<int:pk>/', cache_page(60 * 15)(ProductDetailView.as_view()), name='product_detail'),
     path('product/', ProductListView.as_view(), name='product_list'),
     path('', HomepageView.as_view(), name='homepage'),
     path('product/<int:pk>/', ProductDetailView.as_view(), name='product_detail'),
+    path('product/autocomplete/', ProductAutocompleteView.as_view(), name='product_autocomplete'),
+    path('product/export/', CatalogExportView.as_view(), name='catalog_export'),
     path('product/new/', ProductCreateView.as_view(), name='create_product'),
     path('product/<int:pk>/edit/', ProductUpdateView.as_view(), name='update_product'),
     path('product/<int:pk>/delete/', ProductDeleteView.as_view(), name='delete_product'),
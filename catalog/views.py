@@ -1,34 +1,155 @@
+from functools import reduce
+
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView
 from django.shortcuts import redirect, get_object_or_404
 from django.contrib import messages
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.utils.text import slugify
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponseForbidden
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.conf import settings
+from django.core.paginator import InvalidPage, Paginator
 from .models import Product, ContactInfo, BlogPost, Version
 from .forms import FeedbackForm, ProductForm, VersionForm
 from django.views import View
-from catalog.services import get_categories
+from catalog.autocomplete import autocomplete
+from catalog.exporters import EXPORT_FORMATS, iter_export
+from catalog.pagination import CachedProductPaginator, KeysetPaginator
+from catalog.search import search_products
+from catalog.services import (
+    attach_cache_generations, blogpost_listing_queryset, cached, get_blogpost_count, get_categories,
+    get_estimated_product_count, PAGE_CACHE_TIMEOUT, get_generation, get_generations, merge_pending_views,
+    page_cache_key, product_cache_key, product_listing_queryset, record_blogpost_view
+)
 from django.core.cache import cache
+from myshop.metrics import record_cache_lookup
+from myshop.replicas import pin_request_to_primary
+
+
+class PaginationModeMixin:
+    # При CATALOG_PAGINATION = 'keyset' параметр page содержит непрозрачный курсор, а не номер
+    keyset_count = None
+
+    def use_keyset_pagination(self):
+        return settings.CATALOG_PAGINATION == 'keyset'
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_keyset_pagination():
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(queryset, page_size, count=self.keyset_count)
+        try:
+            page = paginator.page(self.request.GET.get(self.page_kwarg))
+        except InvalidPage as e:
+            raise Http404(str(e))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+
+class ObjectPermissionMixin:
+    # Объект выбирается один раз: проверка прав в dispatch и UpdateView/DeleteView работают с одним экземпляром.
+    # Доступ есть у владельца (owner_attr — путь к id владельца) и у пользователей с permission_required
+    related_fields = ()
+    owner_attr = None
+    permission_required = None
+    permission_denied_message = 'У вас нет прав для этого действия.'
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        return queryset.select_related(*self.related_fields) if self.related_fields else queryset
+
+    def get_object(self, queryset=None):
+        if queryset is not None:
+            return super().get_object(queryset)
+        if not hasattr(self, '_object'):
+            self._object = super().get_object()
+        return self._object
+
+    def has_object_permission(self, obj):
+        user = self.request.user
+        if self.owner_attr and user.is_authenticated:
+            if reduce(getattr, self.owner_attr.split('.'), obj) == user.pk:
+                return True
+        return self.permission_required is not None and user.has_perm(self.permission_required)
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.has_object_permission(self.get_object()):
+            return HttpResponseForbidden(self.permission_denied_message)
+        return super().dispatch(request, *args, **kwargs)
 
-class HomepageView(ListView):
+
+class AnonymousPageCacheMixin:
+    # Анонимам отдаётся готовая страница целиком; авторизованным она не подходит —
+    # кнопки редактирования зависят от владельца и прав
+    page_cache_timeout = PAGE_CACHE_TIMEOUT
+
+    def is_page_cacheable(self, request):
+        return (
+            request.method == 'GET'
+            and not request.GET
+            and 'messages' not in request.COOKIES
+            and not request.user.is_authenticated
+        )
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.is_page_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        cache_key = page_cache_key(request.path)
+        content = cache.get(cache_key)
+        record_cache_lookup('page', hits=int(content is not None), misses=int(content is None))
+        if content is not None:
+            return HttpResponse(content)
+
+        # Страница попадёт в кэш — её данные, включая рендер, читаются с основной базы, а не с реплики
+        pin_request_to_primary()
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200 and hasattr(response, 'add_post_render_callback'):
+            response.add_post_render_callback(
+                lambda rendered: cache.set(cache_key, rendered.content, self.page_cache_timeout)
+            )
+        return response
+
+
+class ProductCardsMixin:
+    def get_context_data(self, **kwargs):
+        # Карточки кэшируются под текущим поколением продукта — строки для них читаются с основной базы,
+        # иначе отстающая реплика запишет старые данные под уже сдвинутое поколение
+        pin_request_to_primary()
+        context = super().get_context_data(**kwargs)
+        attach_cache_generations(context['products'])
+        return context
+
+
+class HomepageView(ProductCardsMixin, PaginationModeMixin, ListView):
     model = Product
     template_name = 'catalog/homepage.html'
-    context_object_name = 'page_obj'
+    context_object_name = 'products'
     paginate_by = 10
+    paginator_class = CachedProductPaginator
+    queryset = product_listing_queryset().with_current_version()
+    keyset_count = staticmethod(get_estimated_product_count)
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['latest_products'] = Product.objects.order_by('-created_at')[:5]
+    def get_search_query(self):
+        return self.request.GET.get('q', '').strip()
 
-        products_with_versions = {}
-        for product in context['page_obj']:
-            active_version = product.versions.filter(is_current=True).first()
-            products_with_versions[product.pk] = active_version
+    def get_queryset(self):
+        query = self.get_search_query()
+        if query:
+            return search_products(query, Product.objects.defer('search_vector')).with_current_version()
+        return super().get_queryset()
+
+    def use_keyset_pagination(self):
+        # Результаты поиска упорядочены по релевантности — курсор по дате к ним неприменим
+        return not self.get_search_query() and super().use_keyset_pagination()
 
-        context['products_with_versions'] = products_with_versions
-        context['query'] = self.request.GET.get("q", "")
+    def get_paginator(self, queryset, per_page, *args, **kwargs):
+        if self.get_search_query():
+            return Paginator(queryset, per_page, *args, **kwargs)
+        return super().get_paginator(queryset, per_page, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['latest_products'] = Product.objects.with_current_version().order_by('-created_at')[:5]
+        context['query'] = self.get_search_query()
         return context
 
 
@@ -47,32 +168,28 @@ class ProductCreateView(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
-class ProductUpdateView(UpdateView):
+class ProductUpdateView(ObjectPermissionMixin, UpdateView):
     model = Product
     form_class = ProductForm
     template_name = 'catalog/update_product.html'
+    related_fields = ('owner', 'category')
+    owner_attr = 'owner_id'
+    permission_required = 'catalog.can_change_any_description'
+    permission_denied_message = "У вас нет прав для редактирования этого продукта."
 
     def get_success_url(self):
         messages.success(self.request, 'Продукт успешно обновлён!')
         return reverse_lazy('catalog:product_detail', args=[self.object.pk])
 
-    def dispatch(self, request, *args, **kwargs):
-        product = self.get_object()
-        if request.user != product.owner and not request.user.has_perm('catalog.can_change_any_description'):
-            return HttpResponseForbidden("У вас нет прав для редактирования этого продукта.")
-        return super().dispatch(request, *args, **kwargs)
 
-
-class ProductDeleteView(DeleteView):
+class ProductDeleteView(ObjectPermissionMixin, DeleteView):
     model = Product
     template_name = 'catalog/product_confirm_delete.html'
     success_url = reverse_lazy('catalog:product_list')
-
-    def dispatch(self, request, *args, **kwargs):
-        product = self.get_object()
-        if request.user != product.owner and not request.user.has_perm('catalog.can_change_any_category'):
-            return HttpResponseForbidden("У вас нет прав для удаления этого продукта.")
-        return super().dispatch(request, *args, **kwargs)
+    related_fields = ('owner', 'category')
+    owner_attr = 'owner_id'
+    permission_required = 'catalog.can_change_any_category'
+    permission_denied_message = "У вас нет прав для удаления этого продукта."
 
 
 class UnpublishProductView(View):
@@ -86,11 +203,50 @@ class UnpublishProductView(View):
         return redirect('catalog:product_detail', pk=pk)
 
 
-class ProductListView(ListView):
+class ProductListView(ProductCardsMixin, PaginationModeMixin, ListView):
     model = Product
     template_name = 'catalog/product_list.html'
     context_object_name = 'products'
     paginate_by = 10
+    paginator_class = CachedProductPaginator
+    queryset = product_listing_queryset().with_current_version()
+    keyset_count = staticmethod(get_estimated_product_count)
+
+
+class ProductAutocompleteView(View):
+    max_limit = 20
+
+    def get(self, request):
+        query = request.GET.get('q', '').strip()
+        try:
+            limit = max(1, min(int(request.GET.get('limit', 10)), self.max_limit))
+        except ValueError:
+            limit = 10
+        results = [
+            {'id': pk, 'name': name, 'score': round(score, 1), 'url': reverse('catalog:product_detail', args=[pk])}
+            for pk, name, score in (autocomplete(query, limit) if query else [])
+        ]
+        return JsonResponse({'query': query, 'results': results})
+
+
+class CatalogExportView(LoginRequiredMixin, View):
+    content_types = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson; charset=utf-8'}
+
+    def get(self, request):
+        if not request.user.is_staff:
+            return HttpResponseForbidden("Выгрузка каталога доступна только сотрудникам.")
+        file_format = request.GET.get('format', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            raise Http404('Неизвестный формат выгрузки')
+        compress = request.GET.get('gzip') == '1'
+
+        filename = f'catalog.{file_format}' + ('.gz' if compress else '')
+        response = StreamingHttpResponse(
+            iter_export(file_format, compress=compress),
+            content_type='application/gzip' if compress else self.content_types[file_format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
 
 class ContactView(TemplateView):
@@ -111,12 +267,18 @@ class ContactView(TemplateView):
         return self.get(request, *args, **kwargs)
 
 
-class BlogPostListView(ListView):
+class BlogPostListView(PaginationModeMixin, ListView):
     model = BlogPost
     template_name = 'catalog/blogpost_list.html'
     context_object_name = 'blog_posts'
     paginate_by = 10
-    queryset = BlogPost.objects.filter(is_published=True)
+    queryset = blogpost_listing_queryset()
+    keyset_count = staticmethod(get_blogpost_count)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        merge_pending_views(context['blog_posts'])
+        return context
 
 
 class BlogPostDetailView(DetailView):
@@ -125,10 +287,16 @@ class BlogPostDetailView(DetailView):
     context_object_name = 'blogpost'
 
     def get_object(self, queryset=None):
+        # Фрагмент статьи кэшируется под поколением, поэтому и читается с основной базы
+        pin_request_to_primary()
         blogpost = super().get_object(queryset)
-        blogpost.view_count += 1
-        blogpost.save()
-        return blogpost
+        record_blogpost_view(blogpost.pk)
+        return merge_pending_views([blogpost])[0]
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cache_generation'] = get_generation(f'blogpost:{self.object.pk}')
+        return context
 
 
 class BlogPostCreateView(CreateView):
@@ -144,19 +312,21 @@ class BlogPostCreateView(CreateView):
         return super().form_valid(form)
 
 
-class BlogPostUpdateView(UpdateView):
+class BlogPostUpdateView(ObjectPermissionMixin, UpdateView):
     model = BlogPost
     fields = ['title', 'content', 'preview_image', 'is_published']
     template_name = 'catalog/blogpost_form.html'
+    permission_required = 'catalog.change_blogpost'
 
     def get_success_url(self):
         return reverse_lazy('catalog:blogpost_detail', args=[self.object.pk])
 
 
-class BlogPostDeleteView(DeleteView):
+class BlogPostDeleteView(ObjectPermissionMixin, DeleteView):
     model = BlogPost
     template_name = 'catalog/blogpost_confirm_delete.html'
     success_url = reverse_lazy('catalog:blogpost_list')
+    permission_required = 'catalog.delete_blogpost'
 
 
 class VersionCreateView(CreateView):
@@ -170,41 +340,51 @@ class VersionCreateView(CreateView):
         return super().form_valid(form)
 
 
-class VersionUpdateView(UpdateView):
+class VersionUpdateView(ObjectPermissionMixin, UpdateView):
     model = Version
     form_class = VersionForm
     template_name = 'catalog/version_form.html'
     success_url = reverse_lazy('catalog:homepage')
+    related_fields = ('product',)
+    owner_attr = 'product.owner_id'
+    permission_required = 'catalog.change_version'
 
     def form_valid(self, form):
         messages.success(self.request, 'Версия успешно обновлена!')
         return super().form_valid(form)
 
 
-class VersionDeleteView(DeleteView):
+class VersionDeleteView(ObjectPermissionMixin, DeleteView):
     model = Version
     template_name = 'catalog/version_confirm_delete.html'
     success_url = reverse_lazy('catalog:homepage')
+    related_fields = ('product',)
+    owner_attr = 'product.owner_id'
+    permission_required = 'catalog.delete_version'
 
     def delete(self, request, *args, **kwargs):
         messages.success(request, 'Версия успешно удалена!')
         return super().delete(request, *args, **kwargs)
 
 
-class ProductDetailView(DetailView):
+class ProductDetailView(AnonymousPageCacheMixin, DetailView):
     model = Product
     template_name = 'catalog/product_detail.html'
     context_object_name = 'product'
+    queryset = Product.objects.select_related('category', 'owner').defer('search_vector').with_current_version()
 
     def get_object(self, queryset=None):
-        # Получаем объект из кэша, если он существует
-        product = cache.get(f'product_{self.kwargs["pk"]}')
-        if not product:
-            # Если в кэше объекта нет, загружаем из базы данных
-            product = super().get_object(queryset)
-            # Сохраняем объект в кэше на 15 минут
-            cache.set(f'product_{self.kwargs["pk"]}', product, 60 * 15)
-        return product
+        # Ключ содержит поколение продукта: любое изменение сразу делает запись неактуальной
+        def load():
+            return super(ProductDetailView, self).get_object(queryset)
+
+        return cached(product_cache_key(self.kwargs['pk']), load)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        generations = get_generations(f'product:{self.object.pk}', 'categories')
+        context['cache_generation'] = '-'.join(str(generation) for generation in generations.values())
+        return context
 
 
 class CategoryListView(ListView):
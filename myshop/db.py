@@ -0,0 +1,37 @@
+import django
+from django.core.exceptions import ImproperlyConfigured
+
+# Импортируется из settings — здесь нельзя обращаться к django.conf.settings и к метрикам
+
+
+def connection_max_age(max_age, asgi):
+    # Под ASGI запросы к ORM идут из потоков sync_to_async, а close_old_connections срабатывает в event loop:
+    # постоянные соединения копятся по потокам и не проверяются на границах запроса. Там нужен пул (DB_POOL)
+    return 0 if asgi else max_age
+
+
+def pool_options(min_size, max_size, timeout, max_lifetime):
+    # Встроенный пул psycopg3 (OPTIONS['pool']) появился в Django 5.1
+    if django.VERSION < (5, 1):
+        raise ImproperlyConfigured(
+            f'DB_POOL требует Django 5.1+ (установлен {django.get_version()}); '
+            'без пула используйте DB_CONN_MAX_AGE и DB_CONN_HEALTH_CHECKS'
+        )
+    try:
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        raise ImproperlyConfigured('DB_POOL требует пакет psycopg[pool] (psycopg3 и psycopg_pool)')
+    if not 0 < min_size <= max_size:
+        raise ImproperlyConfigured('Нужно 0 < DB_POOL_MIN_SIZE <= DB_POOL_MAX_SIZE')
+    return {'min_size': min_size, 'max_size': max_size, 'timeout': timeout, 'max_lifetime': max_lifetime}
+
+
+def replica_databases(primary, hosts):
+    # Реплики отличаются от основной базы только хостом; в тестах они зеркалят default
+    replicas = {}
+    for index, host in enumerate(hosts, start=1):
+        alias = 'replica' if index == 1 else f'replica_{index}'
+        replicas[alias] = {
+            **primary, 'HOST': host, 'OPTIONS': dict(primary.get('OPTIONS', {})), 'TEST': {'MIRROR': 'default'},
+        }
+    return replicas
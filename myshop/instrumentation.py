@@ -0,0 +1,291 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django_redis.cache import RedisCache
+from django_redis.client import DefaultClient
+
+from myshop.metrics import observe_connection_pools, observe_request
+
+logger = logging.getLogger('myshop.performance')
+
+# Границы корзин гистограммы длительности запроса, мс
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+METRICS_PREFIX = 'request_metrics'
+VIEWS_KEY = f'{METRICS_PREFIX}:views'
+FLUSH_INTERVAL = 10
+COUNTERS = ('count', 'queries', 'db_ms', 'template_ms', 'cache_hits', 'cache_misses', 'over_budget')
+
+_current = ContextVar('request_metrics', default=None)
+_MISSING = object()
+
+
+class RequestMetrics:
+    __slots__ = ('view', 'queries', 'db_time', 'cache_hits', 'cache_misses', 'template_time', 'render_started')
+
+    def __init__(self):
+        self.view = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.template_time = 0.0
+        self.render_started = None
+
+
+def current_metrics():
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        if metrics is not None:
+            metrics.queries += 1
+            metrics.db_time += elapsed
+        if elapsed * 1000 >= settings.SLOW_QUERY_MS:
+            logger.warning('Медленный запрос %.1f мс (%s): %s', elapsed * 1000,
+                           metrics.view if metrics else '-', sql[:1000])
+
+
+def record_cache(hits, misses):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+class InstrumentedRedisClient(DefaultClient):
+    # Клиент django_redis, считающий попадания и промахи кэша текущего запроса
+
+    def get(self, key, default=None, version=None, client=None):
+        value = super().get(key, default=_MISSING, version=version, client=client)
+        if value is _MISSING:
+            record_cache(0, 1)
+            return default
+        record_cache(1, 0)
+        return value
+
+    def get_many(self, keys, version=None, client=None):
+        keys = list(keys)
+        found = super().get_many(keys, version=version, client=client)
+        record_cache(len(found), len(keys) - len(found))
+        return found
+
+
+def increment_many(amounts):
+    backend = caches['default']
+    if isinstance(backend, RedisCache):
+        # Все счётчики — одним конвейером INCRBY, то есть за один обход до Redis
+        pipeline = backend.client.get_client(write=True).pipeline(transaction=False)
+        for key, amount in amounts.items():
+            pipeline.incrby(backend.client.make_key(key), amount)
+        pipeline.execute()
+        return
+    for key, amount in amounts.items():
+        if not cache.add(key, amount, None):
+            cache.incr(key, amount)
+
+
+class MetricsAggregator:
+    # Накапливает метрики в памяти процесса и раз в FLUSH_INTERVAL секунд переносит их в общий кэш
+    # из фонового потока, чтобы запись не замедляла запрос и не блокировала event loop под ASGI
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = defaultdict(lambda: defaultdict(float))
+        self.last_flush = time.monotonic()
+        self.flushing = False
+
+    def add(self, view, duration_ms, metrics, over_budget):
+        bucket = next(index for index, bound in enumerate(LATENCY_BUCKETS) if duration_ms <= bound)
+        with self.lock:
+            counters = self.pending[view]
+            counters['count'] += 1
+            counters[f'bucket_{bucket}'] += 1
+            counters['queries'] += metrics.queries
+            counters['db_ms'] += metrics.db_time * 1000
+            counters['template_ms'] += metrics.template_time * 1000
+            counters['cache_hits'] += metrics.cache_hits
+            counters['cache_misses'] += metrics.cache_misses
+            counters['over_budget'] += over_budget
+            due = not self.flushing and time.monotonic() - self.last_flush >= FLUSH_INTERVAL
+            if due:
+                self.flushing = True
+        if due:
+            threading.Thread(target=self.background_flush, name='request-metrics-flush', daemon=True).start()
+
+    def background_flush(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Не удалось сохранить метрики запросов')
+        finally:
+            self.flushing = False
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(lambda: defaultdict(float))
+            self.last_flush = time.monotonic()
+        if not pending:
+            return
+        known = set(cache.get(VIEWS_KEY) or ())
+        if not known.issuperset(pending):
+            cache.set(VIEWS_KEY, sorted(known | set(pending)), None)
+        # Время храним в микросекундах: incr работает только с целыми
+        increment_many({
+            f'{METRICS_PREFIX}:{view}:{name}': round(value * 1000) if name.endswith('_ms') else int(value)
+            for view, counters in pending.items()
+            for name, value in counters.items()
+        })
+
+    def reset(self):
+        with self.lock:
+            self.pending.clear()
+        views = cache.get(VIEWS_KEY) or ()
+        names = COUNTERS + tuple(f'bucket_{index}' for index in range(len(LATENCY_BUCKETS)))
+        cache.delete_many([f'{METRICS_PREFIX}:{view}:{name}' for view in views for name in names] + [VIEWS_KEY])
+
+
+aggregator = MetricsAggregator()
+
+
+def load_view_stats():
+    views = cache.get(VIEWS_KEY) or []
+    names = COUNTERS + tuple(f'bucket_{index}' for index in range(len(LATENCY_BUCKETS)))
+    stored = cache.get_many([f'{METRICS_PREFIX}:{view}:{name}' for view in views for name in names])
+    stats = {}
+    for view in views:
+        values = {name: stored.get(f'{METRICS_PREFIX}:{view}:{name}', 0) for name in names}
+        count = values['count']
+        if not count:
+            continue
+        buckets = [values[f'bucket_{index}'] for index in range(len(LATENCY_BUCKETS))]
+        lookups = values['cache_hits'] + values['cache_misses']
+        stats[view] = {
+            'count': count,
+            'p50_ms': histogram_percentile(buckets, 0.5),
+            'p90_ms': histogram_percentile(buckets, 0.9),
+            'p99_ms': histogram_percentile(buckets, 0.99),
+            'queries': values['queries'] / count,
+            'db_ms': values['db_ms'] / 1000 / count,
+            'template_ms': values['template_ms'] / 1000 / count,
+            'cache_hit_ratio': values['cache_hits'] / lookups if lookups else None,
+            'over_budget': values['over_budget'],
+            'histogram': dict(zip([str(bound) for bound in LATENCY_BUCKETS], buckets)),
+        }
+    return stats
+
+
+def histogram_percentile(buckets, fraction):
+    # Оценка сверху: граница корзины, в которую попадает нужный перцентиль
+    target = fraction * sum(buckets)
+    cumulative = 0
+    for bound, amount in zip(LATENCY_BUCKETS, buckets):
+        cumulative += amount
+        if amount and cumulative >= target:
+            return bound
+    return None
+
+
+def server_timing(duration, metrics):
+    parts = [
+        f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+        f'cache;desc="hit={metrics.cache_hits} miss={metrics.cache_misses}"',
+    ]
+    if metrics.template_time:
+        parts.append(f'tpl;dur={metrics.template_time * 1000:.1f}')
+    parts.append(f'total;dur={duration * 1000:.1f}')
+    return ', '.join(parts)
+
+
+def install_query_hook(connection, **kwargs):
+    # Обёртка ставится на соединение один раз и работает и для синхронных, и для асинхронных представлений:
+    # в async-режиме ORM выполняется в отдельном потоке со своими соединениями, а метрики приходят через ContextVar
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+connection_created.connect(install_query_hook)
+
+
+class RequestInstrumentationMiddleware:
+    # Должен стоять первым в MIDDLEWARE, чтобы общее время включало остальные middleware
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            install_query_hook(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - started)
+
+    def finish(self, request, response, metrics, duration):
+        view = metrics.view or 'unresolved'
+        over_budget = (
+            duration * 1000 > settings.REQUEST_TIME_BUDGET_MS or metrics.queries > settings.REQUEST_QUERY_BUDGET
+        )
+        if over_budget:
+            logger.warning(
+                'Превышен бюджет: %s %s (%s) — %.1f мс, %d запросов к БД, %.1f мс в БД',
+                request.method, request.path, view, duration * 1000, metrics.queries, metrics.db_time * 1000,
+            )
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = server_timing(duration, metrics)
+        aggregator.add(view, duration * 1000, metrics, over_budget)
+        observe_request(metrics.view, request.method, response.status_code, duration, metrics.queries)
+        observe_connection_pools()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is not None and request.resolver_match:
+            metrics.view = request.resolver_match.view_name or request.resolver_match._func_path
+
+    def process_template_response(self, request, response):
+        metrics = _current.get()
+        if metrics is not None:
+            # Рендер начинается сразу после template-response middleware
+            metrics.render_started = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: self.finish_render(metrics))
+        return response
+
+    @staticmethod
+    def finish_render(metrics):
+        if metrics.render_started is not None:
+            metrics.template_time += time.perf_counter() - metrics.render_started
+            metrics.render_started = None
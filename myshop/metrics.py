@@ -0,0 +1,119 @@
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client import multiprocess
+
+# Метрики создаются при импорте. Если задан PROMETHEUS_MULTIPROC_DIR (см. settings), значения пишутся
+# в mmap-файлы этого каталога и суммируются по всем воркерам gunicorn при каждом опросе /metrics
+REQUEST_LATENCY = Histogram(
+    'myshop_http_request_duration_seconds', 'Длительность обработки запроса',
+    ['view', 'method', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUEST_QUERIES = Histogram(
+    'myshop_db_queries_per_request', 'Число SQL-запросов за HTTP-запрос',
+    ['view'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100),
+)
+CACHE_LOOKUPS = Counter(
+    'myshop_cache_lookups_total', 'Обращения к кэшу по семействам ключей',
+    ['family', 'result'],
+)
+EMAIL_SEND_DURATION = Histogram(
+    'myshop_email_send_duration_seconds', 'Время отправки одного письма из очереди',
+    ['outcome'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+DB_CONNECTIONS_OPENED = Counter(
+    'myshop_db_connections_opened', 'Новые соединения с БД — при работающих постоянных соединениях растёт медленно',
+    ['alias'],
+)
+# Насыщение пула psycopg3: in_use / max → 1 и ненулевое ожидание означают, что пул мал для нагрузки.
+# livesum суммирует значения живых воркеров gunicorn
+DB_POOL_CONNECTIONS = Gauge(
+    'myshop_db_pool_connections', 'Соединения пула по состоянию (in_use, idle, max)',
+    ['alias', 'state'], multiprocess_mode='livesum',
+)
+DB_POOL_WAITING = Gauge(
+    'myshop_db_pool_waiting_requests', 'Запросы, ожидающие свободного соединения из пула',
+    ['alias'], multiprocess_mode='livesum',
+)
+DB_POOL_WAIT = Counter(
+    'myshop_db_pool_wait_seconds', 'Суммарное время ожидания соединения из пула',
+    ['alias'],
+)
+DB_POOL_TIMEOUTS = Counter(
+    'myshop_db_pool_timeouts', 'Запросы, не дождавшиеся соединения из пула',
+    ['alias'],
+)
+
+# Гистограммы строятся только по представлениям приложений — иначе число серий не ограничено
+TRACKED_NAMESPACES = ('catalog:', 'users:')
+_FAMILY_RE = re.compile(r'_\d+$')
+
+
+def view_label(view_name):
+    if view_name and view_name.startswith(TRACKED_NAMESPACES):
+        return view_name
+    return 'other'
+
+
+def observe_request(view_name, method, status_code, duration, queries):
+    view = view_label(view_name)
+    REQUEST_LATENCY.labels(view, method, f'{status_code // 100}xx').observe(duration)
+    REQUEST_QUERIES.labels(view).observe(queries)
+
+
+def key_family(key):
+    # product_12:g… → product, product_row:12 → product_row, page:/product/3/ → page
+    return _FAMILY_RE.sub('', key.split(':', 1)[0])
+
+
+def record_cache_lookup(family, hits=0, misses=0):
+    if hits:
+        CACHE_LOOKUPS.labels(family, 'hit').inc(hits)
+    if misses:
+        CACHE_LOOKUPS.labels(family, 'miss').inc(misses)
+
+
+def record_new_connection(sender, connection, **kwargs):
+    DB_CONNECTIONS_OPENED.labels(connection.alias).inc()
+
+
+connection_created.connect(record_new_connection)
+
+
+def observe_connection_pools():
+    for alias in connections:
+        connection = connections[alias]
+        if not connection.settings_dict.get('OPTIONS', {}).get('pool'):
+            continue
+        pool = connection.pool
+        if pool is None:
+            continue
+        # pop_stats обнуляет накопительные счётчики пула, поэтому их можно прибавлять к Counter
+        stats = pool.pop_stats()
+        in_use = stats.get('pool_size', 0) - stats.get('pool_available', 0)
+        DB_POOL_CONNECTIONS.labels(alias, 'in_use').set(in_use)
+        DB_POOL_CONNECTIONS.labels(alias, 'idle').set(stats.get('pool_available', 0))
+        DB_POOL_CONNECTIONS.labels(alias, 'max').set(stats.get('pool_max', 0))
+        DB_POOL_WAITING.labels(alias).set(stats.get('requests_waiting', 0))
+        DB_POOL_WAIT.labels(alias).inc(stats.get('requests_wait_ms', 0) / 1000)
+        DB_POOL_TIMEOUTS.labels(alias).inc(stats.get('requests_errors', 0))
+
+
+def collect_metrics():
+    if settings.PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=settings.PROMETHEUS_MULTIPROC_DIR)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def child_exit(server, worker):
+    # Хук gunicorn: gunicorn.conf.py → from myshop.metrics import child_exit
+    if settings.PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(worker.pid, settings.PROMETHEUS_MULTIPROC_DIR)
@@ -0,0 +1,162 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger('myshop.performance')
+
+# Модели, которые читаются с реплик. Остальные (пользователи, сессии, очередь писем) всегда идут в основную базу
+REPLICATED_MODELS = frozenset({
+    'catalog.product', 'catalog.category', 'catalog.version', 'catalog.blogpost', 'catalog.contactinfo',
+})
+PIN_COOKIE = 'db_primary'
+
+# На PostgreSQL-реплике — секунды с последней применённой транзакции, 0 если реплика догнала мастер
+LAG_SQL = (
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+
+class RoutingState:
+    __slots__ = ('pinned', 'wrote')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+# Изменяемый объект, а не флаг: запись из потока sync_to_async должна быть видна middleware
+_state = ContextVar('replica_routing', default=None)
+_primary_only = ContextVar('replica_primary_only', default=False)
+_lag_checks = {}
+_lag_lock = threading.Lock()
+
+
+def replica_lag(alias):
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(LAG_SQL)
+            return float(cursor.fetchone()[0] or 0)
+    except DatabaseError:
+        logger.warning('Реплика %s недоступна', alias, exc_info=True)
+        return None
+
+
+def replica_is_healthy(alias):
+    now = time.monotonic()
+    checked = _lag_checks.get(alias)
+    if checked is not None and now - checked[0] < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return checked[1]
+    with _lag_lock:
+        checked = _lag_checks.get(alias)
+        if checked is not None and now - checked[0] < settings.REPLICA_LAG_CHECK_INTERVAL:
+            return checked[1]
+        lag = replica_lag(alias)
+        healthy = lag is not None and lag <= settings.REPLICA_MAX_LAG_SECONDS
+        if lag is not None and not healthy:
+            logger.warning('Реплика %s отстаёт на %.1f с — чтение идёт с основной базы', alias, lag)
+        _lag_checks[alias] = (time.monotonic(), healthy)
+        return healthy
+
+
+def reset_lag_checks():
+    _lag_checks.clear()
+
+
+@contextmanager
+def read_from_primary():
+    # То, что сохраняется в кэш, читается с основной базы. Иначе после записи отстающая реплика
+    # вернёт старые данные, и они лягут под уже сдвинутое поколение на весь TTL
+    token = _primary_only.set(True)
+    try:
+        yield
+    finally:
+        _primary_only.reset(token)
+
+
+def pin_request_to_primary():
+    # До конца текущего запроса, включая отложенный рендер шаблона
+    state = _state.get()
+    if state is not None:
+        state.pinned = True
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower not in REPLICATED_MODELS or not settings.DATABASE_REPLICAS:
+            return DEFAULT_DB_ALIAS
+        state = _state.get()
+        if _primary_only.get() or (state is not None and (state.pinned or state.wrote)):
+            return DEFAULT_DB_ALIAS
+        # Внутри транзакции читаем то, что сами только что записали
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = [alias for alias in settings.DATABASE_REPLICAS if replica_is_healthy(alias)]
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if model._meta.label_lower in REPLICATED_MODELS:
+            state = _state.get()
+            if state is not None:
+                state.wrote = True
+        # Явно, иначе Django запишет объект туда, откуда он был прочитан, — на реплику
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware:
+    # После записи в каталог ставит cookie: следующие REPLICA_PIN_SECONDS секунд запросы пользователя
+    # читают с основной базы и видят свои изменения, даже если реплика ещё не догнала мастер
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(response, state)
+
+    async def __acall__(self, request):
+        state = RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(response, state)
+
+    def finish(self, response, state):
+        if state.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+        return response
@@ -1,10 +1,37 @@
+import os
 from pathlib import Path
 import environ
 
+from myshop.db import connection_max_age, pool_options, replica_databases
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 env = environ.Env(
-    DEBUG=(bool, False))
+    DEBUG=(bool, False),
+    CATALOG_PAGINATION=(str, 'offset'),
+    IMAGE_PROCESSING_WORKERS=(int, 2),
+    IMAGE_PROCESSING_SYNC=(bool, False),
+    SERVE_MEDIA=(bool, True),
+    MEDIA_ACCEL_REDIRECT_PREFIX=(str, ''),
+    REQUEST_TIME_BUDGET_MS=(int, 500),
+    REQUEST_QUERY_BUDGET=(int, 30),
+    SLOW_QUERY_MS=(int, 100),
+    SERVER_TIMING_HEADER=(bool, True),
+    PROMETHEUS_MULTIPROC_DIR=(str, ''),
+    METRICS_TOKEN=(str, ''),
+    CATALOG_ASYNC_VIEWS=(bool, False),
+    DB_CONN_MAX_AGE=(int, 60),
+    DB_CONN_HEALTH_CHECKS=(bool, True),
+    DB_POOL=(bool, False),
+    DB_POOL_MIN_SIZE=(int, 2),
+    DB_POOL_MAX_SIZE=(int, 10),
+    DB_POOL_TIMEOUT=(float, 10.0),
+    DB_POOL_MAX_LIFETIME=(float, 1800.0),
+    DB_REPLICA_HOSTS=(list, []),
+    REPLICA_MAX_LAG_SECONDS=(float, 5.0),
+    REPLICA_LAG_CHECK_INTERVAL=(float, 5.0),
+    REPLICA_PIN_SECONDS=(int, 5),
+)
 
 environ.Env.read_env(BASE_DIR / '.env')
 
@@ -28,6 +55,8 @@ INSTALLED_APPS = [
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
 MIDDLEWARE = [
+    'myshop.instrumentation.RequestInstrumentationMiddleware',
+    'myshop.replicas.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -39,12 +68,20 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'myshop.urls'
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if not DEBUG:
+    # Шаблоны компилируются один раз на процесс
+    TEMPLATE_LOADERS = [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -65,12 +102,36 @@ DATABASES = {
         'PASSWORD': env('DB_PASSWORD'),
         'HOST': env('DB_HOST'),
         'PORT': env('DB_PORT'),
+        # Постоянные соединения: TLS и аутентификация не повторяются на каждый запрос,
+        # а health check отбрасывает соединение, оборванное сервером, в начале запроса. Под ASGI
+        # (CATALOG_ASYNC_VIEWS) отключаются — см. myshop.db.connection_max_age
+        'CONN_MAX_AGE': connection_max_age(env('DB_CONN_MAX_AGE'), env('CATALOG_ASYNC_VIEWS')),
+        'CONN_HEALTH_CHECKS': env('DB_CONN_HEALTH_CHECKS'),
+        'OPTIONS': {},
         'TEST': {
             'NAME': 'new_test_db',
         },
     }
 }
 
+if env('DB_POOL'):
+    # Пул psycopg3 сам держит соединения — постоянные соединения Django с ним несовместимы
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = pool_options(
+        env('DB_POOL_MIN_SIZE'), env('DB_POOL_MAX_SIZE'), env('DB_POOL_TIMEOUT'), env('DB_POOL_MAX_LIFETIME'),
+    )
+
+# Реплики для чтения каталога: DB_REPLICA_HOSTS=host1,host2 → алиасы replica, replica_2
+DATABASES.update(replica_databases(DATABASES['default'], env('DB_REPLICA_HOSTS')))
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['myshop.replicas.ReplicaRouter']
+# Реплика, отставшая больше чем на REPLICA_MAX_LAG_SECONDS, пропускается; отставание проверяется
+# не чаще раза в REPLICA_LAG_CHECK_INTERVAL секунд на процесс
+REPLICA_MAX_LAG_SECONDS = env('REPLICA_MAX_LAG_SECONDS')
+REPLICA_LAG_CHECK_INTERVAL = env('REPLICA_LAG_CHECK_INTERVAL')
+# После записи пользователь читает с основной базы столько секунд, чтобы видеть свои изменения
+REPLICA_PIN_SECONDS = env('REPLICA_PIN_SECONDS')
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -83,7 +144,8 @@ CACHES = {
         "BACKEND": "django_redis.cache.RedisCache",
         "LOCATION": env('REDIS_URL'),
         "OPTIONS": {
-            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            # DefaultClient со счётчиками попаданий/промахов для myshop.instrumentation
+            "CLIENT_CLASS": "myshop.instrumentation.InstrumentedRedisClient",
         }
     }
 }
@@ -95,10 +157,45 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / "static"]
+STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+if not DEBUG:
+    # collectstatic добавляет хэш содержимого в имена файлов — их можно кэшировать навсегда
+    STORAGES['staticfiles']['BACKEND'] = 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'
+
+# Без DEBUG медиа и статика отдаются catalog.media с ETag, Range и долгим Cache-Control.
+# Если задан префикс, саму отдачу выполняет nginx через X-Accel-Redirect
+SERVE_MEDIA = env('SERVE_MEDIA')
+MEDIA_ACCEL_REDIRECT_PREFIX = env('MEDIA_ACCEL_REDIRECT_PREFIX')
+
+# Производные изображения (миниатюры, WebP/AVIF) готовятся в пуле процессов, см. catalog.images
+IMAGE_PROCESSING_WORKERS = env('IMAGE_PROCESSING_WORKERS')
+IMAGE_PROCESSING_SYNC = env('IMAGE_PROCESSING_SYNC')
+
 AUTH_USER_MODEL = 'users.CustomUser'
+# Бюджеты запроса для RequestInstrumentationMiddleware: превышения пишутся в лог myshop.performance,
+# сводка по представлениям — manage.py request_stats
+REQUEST_TIME_BUDGET_MS = env('REQUEST_TIME_BUDGET_MS')
+REQUEST_QUERY_BUDGET = env('REQUEST_QUERY_BUDGET')
+SLOW_QUERY_MS = env('SLOW_QUERY_MS')
+SERVER_TIMING_HEADER = env('SERVER_TIMING_HEADER')
+
+# Метрики Prometheus (/metrics). С несколькими воркерами gunicorn нужен общий каталог для mmap-файлов:
+# его очищают перед запуском, а в gunicorn.conf.py подключают хук myshop.metrics.child_exit
+PROMETHEUS_MULTIPROC_DIR = env('PROMETHEUS_MULTIPROC_DIR')
+if PROMETHEUS_MULTIPROC_DIR:
+    # prometheus_client читает переменную окружения при импорте
+    os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', PROMETHEUS_MULTIPROC_DIR)
+METRICS_TOKEN = env('METRICS_TOKEN')
+
+# Права пользователя кэшируются в Redis, см. users.backends
+AUTHENTICATION_BACKENDS = ['users.backends.CachedPermissionBackend']
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.yandex.ru'
@@ -106,5 +203,12 @@ EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = env('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD')
+# Воркер send_outbox не должен зависать на медленном SMTP
+EMAIL_TIMEOUT = 10
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# 'offset' — обычная нумерация страниц, 'keyset' — курсорная пагинация по (created_at, id)
+CATALOG_PAGINATION = env('CATALOG_PAGINATION')
+# Нативные async-представления для главной, списков и карточки товара — имеет смысл только под ASGI (uvicorn)
+CATALOG_ASYNC_VIEWS = env('CATALOG_ASYNC_VIEWS')
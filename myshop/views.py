@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_safe
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from myshop.metrics import collect_metrics
+
+
+@require_safe
+def metrics_view(request):
+    if not settings.METRICS_TOKEN and not settings.DEBUG:
+        # Без токена метрики отдаются только при разработке — наружу они не должны быть видны
+        raise Http404
+    if settings.METRICS_TOKEN:
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not constant_time_compare(token, settings.METRICS_TOKEN):
+            return HttpResponseForbidden('Неверный токен')
+    return HttpResponse(collect_metrics(), content_type=CONTENT_TYPE_LATEST)
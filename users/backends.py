@@ -0,0 +1,38 @@
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from catalog.services import CACHE_TIMEOUT, bump_generation, versioned_key
+
+PERMISSIONS_NAMESPACE = 'permissions'
+
+
+def user_permissions_namespace(user_pk):
+    return f'permissions:user:{user_pk}'
+
+
+def permission_cache_key(user_pk):
+    # Общее поколение сбрасывается при изменении прав групп, личное — при изменении групп и прав пользователя
+    return versioned_key(f'user_perms_{user_pk}', PERMISSIONS_NAMESPACE, user_permissions_namespace(user_pk))
+
+
+def invalidate_permissions(*user_pks):
+    if not user_pks:
+        bump_generation(PERMISSIONS_NAMESPACE)
+    for user_pk in user_pks:
+        bump_generation(user_permissions_namespace(user_pk))
+
+
+class CachedPermissionBackend(ModelBackend):
+    # Набор прав пользователя хранится в кэше, поэтому повторные проверки has_perm не ходят в БД
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            key = permission_cache_key(user_obj.pk)
+            permissions = cache.get(key)
+            if permissions is None:
+                permissions = super().get_all_permissions(user_obj)
+                cache.set(key, permissions, CACHE_TIMEOUT)
+            user_obj._perm_cache = set(permissions)
+        return user_obj._perm_cache
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.outbox import BATCH_SIZE, MAX_ATTEMPTS, deliver_outbox, requeue_dead
+
+
+class Command(BaseCommand):
+    help = 'Отправляет письма из очереди OutgoingEmail'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Проверять очередь каждые N секунд (0 — выполнить один раз)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS,
+                            help='После стольких неудачных попыток письмо помечается как недоставленное')
+        parser.add_argument('--requeue-dead', action='store_true',
+                            help='Вернуть недоставленные письма в очередь перед отправкой')
+
+    def handle(self, *args, **options):
+        if options['requeue_dead']:
+            self.stdout.write(f'Возвращено в очередь: {requeue_dead()}')
+        interval = options['interval']
+        while True:
+            sent, retried, dead = deliver_outbox(options['batch_size'], options['max_attempts'])
+            if sent or retried or dead or not interval:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Отправлено: {sent}, отложено: {retried}, не доставлено: {dead}'
+                ))
+            if not interval:
+                break
+            time.sleep(interval)
@@ -0,0 +1,137 @@
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connection as db_connection, transaction
+from django.utils import timezone
+
+from myshop.metrics import EMAIL_SEND_DURATION
+
+from .models import OutgoingEmail
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 6
+RETRY_BASE_DELAY = 60
+RETRY_MAX_DELAY = 6 * 60 * 60
+# На это время выбранные письма скрыты от других воркеров; если воркер упал, они вернутся в очередь
+CLAIM_LEASE = timedelta(minutes=5)
+
+
+def enqueue_mail(subject, message, recipient_list, from_email=None, html_message=''):
+    # Письмо уходит воркером send_outbox. Чтобы оно не потерялось и не ушло без изменений, к которым относится,
+    # вызывайте enqueue_mail в одном transaction.atomic() с ними — ATOMIC_REQUESTS выключен
+    return OutgoingEmail.objects.create(
+        subject=subject,
+        body=message,
+        html_body=html_message or '',
+        from_email=from_email or settings.EMAIL_HOST_USER,
+        recipients=list(recipient_list),
+    )
+
+
+def retry_delay(attempts):
+    delay = min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+    return timedelta(seconds=delay * random.uniform(1, 1.1))
+
+
+def claim_batch(batch_size=BATCH_SIZE):
+    now = timezone.now()
+    with transaction.atomic():
+        queryset = OutgoingEmail.objects.filter(
+            status=OutgoingEmail.STATUS_PENDING, next_attempt_at__lte=now,
+        ).order_by('next_attempt_at', 'pk')
+        if db_connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        batch = list(queryset[:batch_size])
+        if batch:
+            OutgoingEmail.objects.filter(pk__in=[email.pk for email in batch]).update(next_attempt_at=now + CLAIM_LEASE)
+    return batch
+
+
+def build_message(email, connection):
+    message = EmailMultiAlternatives(
+        email.subject, email.body, email.from_email, email.recipients, connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def _record_failure(email, error, max_attempts):
+    email.attempts += 1
+    email.last_error = f'{type(error).__name__}: {error}'
+    if email.attempts >= max_attempts:
+        email.status = OutgoingEmail.STATUS_DEAD
+    else:
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+    return email.status
+
+
+def _fail_batch(emails, error, max_attempts):
+    retried = dead = 0
+    for email in emails:
+        if _record_failure(email, error, max_attempts) == OutgoingEmail.STATUS_DEAD:
+            dead += 1
+        else:
+            retried += 1
+    return retried, dead
+
+
+def deliver_outbox(batch_size=BATCH_SIZE, max_attempts=MAX_ATTEMPTS, connection=None):
+    # Все созревшие письма уходят через одно SMTP-соединение; возвращает (отправлено, отложено, в dead letter)
+    sent = retried = dead = 0
+    connection = connection or get_connection(fail_silently=False)
+    try:
+        while batch := claim_batch(batch_size):
+            try:
+                connection.open()
+            except Exception as error:
+                # SMTP недоступен: попытка засчитывается всему пакету, письма уходят на backoff до следующего запуска
+                batch_retried, batch_dead = _fail_batch(batch, error, max_attempts)
+                retried += batch_retried
+                dead += batch_dead
+                break
+            delivered = []
+            broken = False
+            for index, email in enumerate(batch):
+                started = time.perf_counter()
+                try:
+                    connection.send_messages([build_message(email, connection)])
+                except Exception as error:
+                    EMAIL_SEND_DURATION.labels('failed').observe(time.perf_counter() - started)
+                    if _record_failure(email, error, max_attempts) == OutgoingEmail.STATUS_DEAD:
+                        dead += 1
+                    else:
+                        retried += 1
+                    # После ошибки соединение могло остаться в неопределённом состоянии
+                    try:
+                        connection.close()
+                        connection.open()
+                    except Exception as error:
+                        batch_retried, batch_dead = _fail_batch(batch[index + 1:], error, max_attempts)
+                        retried += batch_retried
+                        dead += batch_dead
+                        broken = True
+                        break
+                else:
+                    EMAIL_SEND_DURATION.labels('sent').observe(time.perf_counter() - started)
+                    delivered.append(email.pk)
+            # Текст отправленного письма больше не нужен, а в нём бывают пароли и ссылки активации
+            OutgoingEmail.objects.filter(pk__in=delivered).update(
+                status=OutgoingEmail.STATUS_SENT, sent_at=timezone.now(), last_error='', body='', html_body='',
+            )
+            sent += len(delivered)
+            if broken:
+                break
+    finally:
+        connection.close()
+    return sent, retried, dead
+
+
+def requeue_dead():
+    return OutgoingEmail.objects.filter(status=OutgoingEmail.STATUS_DEAD).update(
+        status=OutgoingEmail.STATUS_PENDING, attempts=0, next_attempt_at=timezone.now(),
+    )
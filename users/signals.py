@@ -0,0 +1,42 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from users.backends import invalidate_permissions
+
+User = get_user_model()
+
+# Поколение сдвигается после коммита: иначе параллельный запрос закэширует ещё старые права под новым поколением
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(post_delete, sender=Group)
+@receiver([post_save, post_delete], sender=Permission)
+def invalidate_group_permissions(sender, **kwargs):
+    if kwargs.get('action', 'post_').startswith('post_'):
+        transaction.on_commit(invalidate_permissions)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_user_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        user_pks = [instance.pk]
+    elif pk_set:
+        user_pks = list(pk_set)
+    else:
+        # group.user_set.clear(): список пользователей уже неизвестен
+        user_pks = []
+    transaction.on_commit(lambda: invalidate_permissions(*user_pks))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_flags(sender, instance, created, update_fields=None, **kwargs):
+    # Права суперпользователя зависят от флагов; обновление last_login при входе их не меняет
+    if not created and update_fields != frozenset({'last_login'}):
+        pk = instance.pk
+        transaction.on_commit(lambda: invalidate_permissions(pk))
@@ -1,3 +1,184 @@
-from django.test import TestCase
+import socket
+import socketserver
+import threading
+from io import StringIO
+from datetime import timedelta
+from smtplib import SMTPRecipientsRefused
 
-# Create your tests here.
+from django.contrib.auth.models import Group, Permission
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.backends.smtp import EmailBackend
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import CustomUser, OutgoingEmail
+from .outbox import deliver_outbox, enqueue_mail
+
+
+class FlakyBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        for message in email_messages:
+            if any(address.startswith('bad') for address in message.to):
+                raise SMTPRecipientsRefused({message.to[0]: (550, b'No such user')})
+            mail.outbox.append(message)
+        return len(email_messages)
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 localhost fake smtp')
+        while line := self.rfile.readline():
+            command = line.decode().strip().upper()
+            if command.startswith('EHLO') or command.startswith('HELO'):
+                self.reply('250 localhost')
+            elif command == 'DATA':
+                self.reply('354 end with .')
+                lines = []
+                while (data := self.rfile.readline()) not in (b'.\r\n', b''):
+                    lines.append(data)
+                self.server.messages.append(b''.join(lines))
+                self.reply('250 queued')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                break
+            else:
+                self.reply('250 ok')
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeSMTPHandler)
+        self.connections = 0
+        self.messages = []
+
+
+class OutboxTests(TestCase):
+    def test_registration_enqueues_activation_email(self):
+        response = self.client.post(reverse('users:register'), {'email': 'new@test.com', 'password': 'secret123'})
+        self.assertRedirects(response, reverse('users:login'), fetch_redirect_response=False)
+        self.assertEqual(len(mail.outbox), 0)
+
+        queued = OutgoingEmail.objects.get()
+        self.assertEqual(queued.recipients, ['new@test.com'])
+        self.assertIn('/users/activate/', queued.body)
+
+        self.assertEqual(deliver_outbox(), (1, 0, 0))
+        self.assertEqual(mail.outbox[0].to, ['new@test.com'])
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, OutgoingEmail.STATUS_SENT)
+        self.assertIsNotNone(queued.sent_at)
+        self.assertEqual(queued.body, '')
+
+    def test_password_reset_enqueues_email(self):
+        CustomUser.objects.create_user(username='reset', email='reset@test.com', password='old')
+        self.client.post(reverse('users:password_reset'), {'email': 'reset@test.com'})
+        self.assertEqual(OutgoingEmail.objects.get().subject, 'Ваш новый пароль')
+        self.assertEqual(len(mail.outbox), 0)
+
+    @override_settings(EMAIL_BACKEND='users.tests.FlakyBackend')
+    def test_failures_back_off_then_dead_letter(self):
+        good = enqueue_mail('Тема', 'Текст', ['good@test.com'])
+        bad = enqueue_mail('Тема', 'Текст', ['bad@test.com'])
+
+        self.assertEqual(deliver_outbox(max_attempts=2), (1, 1, 0))
+        bad.refresh_from_db()
+        self.assertEqual(bad.status, OutgoingEmail.STATUS_PENDING)
+        self.assertEqual(bad.attempts, 1)
+        self.assertIn('SMTPRecipientsRefused', bad.last_error)
+        self.assertGreater(bad.next_attempt_at, timezone.now() + timedelta(seconds=50))
+
+        # Пока не пришло время повтора, письмо не трогаем
+        self.assertEqual(deliver_outbox(max_attempts=2), (0, 0, 0))
+
+        OutgoingEmail.objects.filter(pk=bad.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(deliver_outbox(max_attempts=2), (0, 0, 1))
+        bad.refresh_from_db()
+        self.assertEqual(bad.status, OutgoingEmail.STATUS_DEAD)
+        good.refresh_from_db()
+        self.assertEqual(good.status, OutgoingEmail.STATUS_SENT)
+
+        # Недоставленное письмо можно вернуть в очередь: счётчик попыток начинается заново
+        call_command('send_outbox', '--requeue-dead', stdout=StringIO())
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), (OutgoingEmail.STATUS_PENDING, 1))
+
+    def test_smtp_worker_reuses_one_connection(self):
+        server = FakeSMTPServer()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        for index in range(5):
+            enqueue_mail(f'Письмо {index}', 'Текст', [f'user{index}@test.com'])
+        connection = EmailBackend(host='127.0.0.1', port=server.server_address[1], use_tls=False,
+                                  username='', password='', timeout=5)
+        self.assertEqual(deliver_outbox(batch_size=2, connection=connection), (5, 0, 0))
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(len(server.messages), 5)
+        self.assertFalse(OutgoingEmail.objects.exclude(status=OutgoingEmail.STATUS_SENT).exists())
+
+    def test_unreachable_smtp_counts_as_failed_attempt(self):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        for index in range(3):
+            enqueue_mail(f'Письмо {index}', 'Текст', [f'user{index}@test.com'])
+        connection = EmailBackend(host='127.0.0.1', port=port, use_tls=False, username='', password='', timeout=1)
+        self.assertEqual(deliver_outbox(batch_size=2, connection=connection), (0, 2, 0))
+        failed = OutgoingEmail.objects.filter(attempts=1)
+        self.assertEqual(failed.count(), 2)
+        self.assertTrue(all(email.next_attempt_at > timezone.now() + timedelta(seconds=50) for email in failed))
+        self.assertTrue(all('ConnectionRefusedError' in email.last_error for email in failed))
+
+
+class CachedPermissionBackendTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username='mod', email='mod@test.com', password='password123')
+        self.group = Group.objects.create(name='Модераторы')
+        self.unpublish = Permission.objects.get(codename='can_unpublish_product')
+        self.group.permissions.add(self.unpublish)
+        self.user.groups.add(self.group)
+
+    def fresh_user(self):
+        return CustomUser.objects.get(pk=self.user.pk)
+
+    def test_warm_permission_checks_skip_database(self):
+        self.assertTrue(self.fresh_user().has_perm('catalog.can_unpublish_product'))
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm('catalog.can_unpublish_product'))
+            self.assertFalse(user.has_perm('catalog.delete_product'))
+
+    def test_group_permission_change_invalidates(self):
+        self.assertFalse(self.fresh_user().has_perm('catalog.delete_product'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.permissions.add(Permission.objects.get(codename='delete_product'))
+        self.assertTrue(self.fresh_user().has_perm('catalog.delete_product'))
+
+    def test_membership_change_invalidates(self):
+        self.assertTrue(self.fresh_user().has_perm('catalog.can_unpublish_product'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.user_set.remove(self.user)
+        self.assertFalse(self.fresh_user().has_perm('catalog.can_unpublish_product'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.add(self.group)
+        self.assertTrue(self.fresh_user().has_perm('catalog.can_unpublish_product'))
+
+    def test_create_groups_command_invalidates(self):
+        self.assertFalse(self.fresh_user().has_perm('catalog.change_product'))
+        # Команда не сбрасывает кэш сама: permissions.set() вызывает m2m_changed
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('create_groups', stdout=StringIO())
+        self.assertTrue(self.fresh_user().has_perm('catalog.change_product'))
@@ -1,7 +1,5 @@
 from django.views.generic.edit import FormView
 from django.urls import reverse_lazy
-from django.core.mail import send_mail
-from django.conf import settings
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes
 from django.contrib.auth.tokens import default_token_generator
@@ -12,8 +10,10 @@ from .forms import UserRegistrationForm, PasswordResetForm
 from django.contrib.auth.views import LoginView
 from django.urls import reverse
 from django.contrib.auth.hashers import make_password
+from django.db import transaction
 from django.utils.crypto import get_random_string
 from .models import CustomUser
+from .outbox import enqueue_mail
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic.edit import UpdateView
 from django.views.generic.detail import DetailView
@@ -31,10 +31,11 @@ class PasswordResetView(FormView):
         if user:
             new_password = get_random_string(8)
             user.password = make_password(new_password)
-            user.save()
             mail_subject = 'Ваш новый пароль'
             message = f'Ваш новый пароль: {new_password}. Пожалуйста, смените его после входа.'
-            send_mail(mail_subject, message, settings.EMAIL_HOST_USER, [email], fail_silently=False)
+            with transaction.atomic():
+                user.save()
+                enqueue_mail(mail_subject, message, [email])
 
         return super().form_valid(form)
 
@@ -68,8 +69,13 @@ class RegistrationView(FormView):
     def form_valid(self, form):
         user = form.save(commit=False)
         user.is_active = False
-        user.save()
         mail_subject = 'Активируйте свой аккаунт'
+        with transaction.atomic():
+            user.save()
+            self.enqueue_activation(user, mail_subject)
+        return super().form_valid(form)
+
+    def enqueue_activation(self, user, mail_subject):
         uid = urlsafe_base64_encode(force_bytes(user.pk))
         token = default_token_generator.make_token(user)
         activation_link = reverse('users:activate', kwargs={'uidb64': uid, 'token': token})
@@ -79,8 +85,7 @@ class RegistrationView(FormView):
             'activation_url': activation_url,
         })
 
-        send_mail(mail_subject, message, settings.EMAIL_HOST_USER, [user.email], fail_silently=False)
-        return super().form_valid(form)
+        enqueue_mail(mail_subject, message, [user.email])
 
 
 class ProfileDetailView(LoginRequiredMixin, DetailView):